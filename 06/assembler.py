@@ -1,83 +1,241 @@
 import argparse
+import cProfile
+import glob
+import io
+import os
 import re
+import signal
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
-from modules.code import Code
+from modules.assembly import assemble_instructions
+from modules.assembly_cache import AssemblyCache
+from modules.assembly_server import AssemblyServer
+from modules.assembly_stats import AssemblyStats
+from modules.hack_writer import FORMATS
 from modules.parser import Parser
 from modules.parse_error import ParseError
-from modules.symbol_table import SymbolTable
-
-# helper function to translate an a instruction to a binary string
-# assumes that symbol is an integer
-def translate_a_instruction(symbol):
-    return format(int(symbol), '016b')
-
-# helper function to translate a c instruction to a binary string
-def translate_c_instruction(comp, dest, jump):
-    code = Code(comp, dest, jump)
-    return "111{}{}{}".format(code.comp(), code.dest(), code.jump())
-
-def main(infile):
-    # read the input file into a list, remove whitespace
-    input = []
-    binary_lines = []
-    with open(infile) as f:
-        input = f.readlines()
-
-    # first pass, build symbol table
-    parser = Parser(input)
-    symbol_table = SymbolTable()
-    rom_addr = 0
-    while parser.has_more_commands():
-        parser.advance()
-        try:
-            if parser.command_type() == parser.C_COMMAND or parser.command_type() == parser.A_COMMAND:
-                rom_addr += 1
-            elif parser.command_type() == parser.L_COMMAND:
-                symbol = parser.symbol()
-                symbol_table.add_entry(symbol, rom_addr)
-        except ParseError as err:
-            print("Parser error. Expression: {}. Error detail: {}".format(err.expression, err.message))
-            exit(1)
-    
-    # second pass
-    parser = Parser(input)
-    ram_addr = 16
-    while parser.has_more_commands():
-        parser.advance()
+from modules.rom_report import ROM_SIZE, RomReport
+from modules.symbol_map import SymbolMap
+
+# size of the read buffer used to stream the input file
+READ_BUFFER_SIZE = 1 << 16
+
+# part of every cache key. change it whenever the encoding of any program changes
+ASSEMBLER_VERSION = "1.0"
+
+# assemble infile into a file with the extension of the output format.
+# returns the name of the output file. written to a temporary file first so
+# a failed assembly does not leave a partial output behind.
+# with a cache, an unchanged file is copied from the cache instead, and in
+# incremental mode only the regions that changed are encoded again.
+# if stats is given, the file is always assembled in full to fill it
+# (--stats and --rom-report).
+# optimize runs the peephole optimizer, and also assembles the file in full.
+# fails if the program needs more than rom_size words (None for no limit).
+# with symbols, a symbol map is written next to the output as <infile>.sym.json.
+# it needs the source lines, so the file is also assembled in full
+def assemble_file(infile, format="hack", cache=None, incremental=False, stats=None, optimize=False,
+                  rom_size=ROM_SIZE, symbols=False):
+    (extension, writer_factory) = FORMATS[format]
+    basename = re.sub(r"\.asm$", "", infile)
+    outfile = "{}{}".format(basename, extension)
+    full = stats is not None or optimize or symbols
+    key = None
+    if cache is not None:
+        key = cache.key(infile, format, "-O" if optimize else "", str(rom_size))
+        if not full and cache.fetch(key, outfile):
+            return outfile
+
+    symbol_map = SymbolMap(os.path.basename(infile)) if symbols else None
+
+    tmpfile = "{}.tmp".format(outfile)
+    try:
+        with open(tmpfile, "w+b") as out_f:
+            symbol_table = None
+            includes = []
+            if incremental and not full:
+                symbol_table = cache.assemble_incremental(infile, writer_factory(out_f), rom_size)
+            if symbol_table is None:
+                with open(infile, buffering=READ_BUFFER_SIZE) as in_f:
+                    parser = Parser(in_f, infile)
+                    assemble_instructions(parser, writer_factory(out_f), stats, optimize, rom_size, symbol_map)
+                includes = parser.includes
+    except:
+        if os.path.exists(tmpfile):
+            os.remove(tmpfile)
+        raise
+    os.replace(tmpfile, outfile)
+    if symbol_map is not None:
+        symfile = "{}{}".format(basename, SymbolMap.EXTENSION)
+        with open("{}.tmp".format(symfile), "w") as sym_f:
+            symbol_map.write(sym_f)
+        os.replace("{}.tmp".format(symfile), symfile)
+    if cache is not None:
+        cache.store(key, outfile, includes)
+    return outfile
+
+# assemble a single file as one job of a batch, possibly in a worker process.
+# errors are reported rather than raised.
+# with profile, cProfile data of the job is dumped to <infile>.prof.
+# stats are collected if stats or rom_report is set.
+# returns (infile, outfile, error message or None, elapsed seconds, stats or None)
+def assemble_job(infile, format="hack", cache=None, incremental=False, stats=False, profile=False, optimize=False,
+                 rom_report=False, symbols=False):
+    start = time.perf_counter()
+    outfile = None
+    error = None
+    job_stats = AssemblyStats() if stats or rom_report else None
+    profiler = cProfile.Profile() if profile else None
+    try:
+        if profiler is not None:
+            profiler.enable()
+        outfile = assemble_file(infile, format, cache, incremental, job_stats, optimize, symbols=symbols)
+    except ParseError as err:
+        error = "Parser error. Expression: {}. Error detail: {}".format(err.expression, err.message)
+    except OSError as err:
+        error = "Error attempting to assemble file: {}".format(err)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats("{}.prof".format(re.sub(r"\.asm$", "", infile)))
+    return (infile, outfile, error, time.perf_counter() - start, job_stats)
+
+# assemble a request of the --serve daemon, see AssemblyRequestHandler.
+# the output is assembled in memory, returns (number of words, output bytes)
+def assemble_request(request):
+    for field in ("source", "path", "format"):
+        if field in request and not isinstance(request[field], str):
+            raise ValueError("{} must be a string".format(field))
+    format = request.get("format", "hack")
+    if format not in FORMATS:
+        raise ValueError("unknown format {}".format(format))
+    writer_factory = FORMATS[format][1]
+    out_f = io.BytesIO()
+    writer = writer_factory(out_f)
+    optimize = bool(request.get("optimize", False))
+    if "source" in request:
+        assemble_instructions(Parser(io.StringIO(request["source"])), writer, optimize=optimize)
+    else:
+        with open(request["path"], buffering=READ_BUFFER_SIZE) as in_f:
+            assemble_instructions(Parser(in_f, request["path"]), writer, optimize=optimize)
+    return (writer.size, out_f.getvalue())
+
+# run the assembler as a daemon serving requests on a unix domain socket
+# until interrupted or terminated, the socket is removed on the way out.
+# refuses to replace anything but a socket no server is listening on
+def serve(socket_path):
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server = AssemblyServer(socket_path, assemble_request)
+    except OSError as err:
+        print("Error attempting to serve on {}: {}".format(socket_path, err))
+        exit(1)
+    with server:
+        print("Serving on {}".format(socket_path))
         try:
-            if parser.command_type() == parser.A_COMMAND:
-                symbol = parser.symbol()
-                
-                try:
-                    # if the symbol is a constant (int), translate it
-                    int_symbol = int(symbol)
-                    binary_lines.append(translate_a_instruction(int_symbol))
-                except ValueError:
-                    # symbol is not an integer, so either look it up, or its a new variable
-                    if symbol_table.contains(symbol):
-                        binary_lines.append(translate_a_instruction(symbol_table.get_address(symbol)))
-                    else:
-                        symbol_table.add_entry(symbol, ram_addr)
-                        binary_lines.append(translate_a_instruction(ram_addr))
-                        ram_addr += 1
-            elif parser.command_type() == parser.C_COMMAND:
-                # Translate C command
-                binary_lines.append(translate_c_instruction(parser.comp(), parser.dest(), parser.jump()))
-        except ParseError as err:
-            print("Parser error. Expression: {}. Error detail: {}".format(err.expression, err.message))
-            exit(1)
-    
-    # translation is done. output to new .hack file
-    outfile = infile.replace(".asm", "")
-    outfile = "{}.hack".format(outfile)
-    with open(outfile, "w") as f:
-        for line in binary_lines:
-            f.write(line)
-            f.write("\n")
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+# expand the command line inputs into a list of .asm files
+# inputs can be files, directories (all .asm files inside) or glob patterns
+def find_input_files(inputs):
+    infiles = []
+    for input in inputs:
+        if os.path.isdir(input):
+            for f in sorted(os.listdir(input)):
+                if re.search(r"\.asm$", f):
+                    infiles.append(os.path.join(input, f))
+        elif re.search(r"[*?[]", input):
+            infiles.extend(sorted(glob.glob(input)))
+        else:
+            infiles.append(input)
+    # the same file given twice is only assembled once
+    return list(dict.fromkeys(infiles))
+
+def main(inputs, format="hack", jobs=None, cache_dir=None, incremental=False, stats=False, profile=False,
+         optimize=False, rom_report=False, symbols=False):
+    infiles = find_input_files(inputs)
+    if not infiles:
+        print("No files found with .asm suffix in {}. Exiting".format(" ".join(inputs)))
+        exit(1)
+
+    cache = None
+    if cache_dir is not None:
+        cache = AssemblyCache(cache_dir, ASSEMBLER_VERSION)
+
+    job = partial(assemble_job, format=format, cache=cache, incremental=incremental, stats=stats, profile=profile,
+                  optimize=optimize, rom_report=rom_report, symbols=symbols)
+    start = time.perf_counter()
+    workers = jobs if jobs is not None else os.cpu_count() or 1
+    if len(infiles) == 1 or workers == 1:
+        # symbol tables are independent, so files can share this process
+        results = [job(infile) for infile in infiles]
+    else:
+        # every job runs in a worker process with its own symbol table
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, len(infiles) // (workers * 4))
+            results = list(executor.map(job, infiles, chunksize=chunksize))
+
+    failed = 0
+    for (infile, outfile, error, seconds, job_stats) in results:
+        if error is not None:
+            failed += 1
+            if len(results) > 1:
+                print("{}: {}".format(infile, error))
+            else:
+                print(error)
+            continue
+        if len(results) > 1 or job_stats is not None:
+            print("{} -> {} ({:.3f}s)".format(infile, outfile, seconds))
+        if stats:
+            for line in job_stats.report():
+                print("    {}".format(line))
+        if rom_report:
+            for line in RomReport(job_stats.labels, job_stats.words).report():
+                print("    {}".format(line))
+
+    if len(results) > 1:
+        print("Assembled {} of {} files in {:.3f}s".format(len(results) - failed, len(results), time.perf_counter() - start))
+    if failed:
+        exit(1)
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument("infile", help="input assembly file")
+    parser.add_argument("inputs", nargs="*", help="input assembly files, directories or glob patterns")
+    parser.add_argument("--format", choices=FORMATS.keys(), default="hack",
+                        help="output format: .hack text (default), raw little/big-endian uint16 .bin, or Intel HEX")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of files assembled in parallel (default: number of cpus)")
+    parser.add_argument("--cache-dir", default=None,
+                        help="directory of a content-addressed cache, unchanged files are not assembled again")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only re-encode the regions of a file that changed since it was last assembled (requires --cache-dir)")
+    parser.add_argument("--stats", action="store_true",
+                        help="print instruction counts, variables, symbol table size and the time of each pass")
+    parser.add_argument("--profile", action="store_true",
+                        help="dump cProfile data of each file to <file>.prof")
+    parser.add_argument("-O", "--optimize", action="store_true",
+                        help="run the peephole optimizer before encoding (the file is always assembled in full)")
+    parser.add_argument("--rom-report", action="store_true",
+                        help="print the ROM size of every function, in words, bytes and percent of ROM")
+    parser.add_argument("--symbols", action="store_true",
+                        help="write the labels, variables and the source line of every rom address to <file>.sym.json")
+    parser.add_argument("--serve", metavar="SOCKET", default=None,
+                        help="keep running and serve assemble requests on the unix domain socket SOCKET")
     args = parser.parse_args()
-    main(args.infile)
\ No newline at end of file
+    if args.serve is not None:
+        serve(args.serve)
+        exit(0)
+    if not args.inputs:
+        parser.error("the following arguments are required: inputs")
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("-j/--jobs must be at least 1")
+    if args.incremental and args.cache_dir is None:
+        parser.error("--incremental requires --cache-dir")
+    main(args.inputs, args.format, args.jobs, args.cache_dir, args.incremental, args.stats, args.profile,
+         args.optimize, args.rom_report, args.symbols)
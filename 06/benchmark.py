@@ -0,0 +1,200 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+import tracemalloc
+
+import assembler
+from modules.assembly import encode_instructions, resolve_fixups
+from modules.code import Code
+from modules.hack_writer import FORMATS, MemoryWriter
+from modules.parser import Parser
+from modules.symbol_table import SymbolTable
+
+# directory holding the real programs: the sources of the 05/*.hack files and the other test programs
+TEST_PROGRAMS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_programs")
+
+# the largest rom address a label can have and still be referenced
+MAX_LABEL_ADDRESS = 32767
+
+# synthetic programs can be larger than the rom, they are assembled without a size limit
+ROM_SIZE = None
+
+# generate a synthetic assembly program as a list of lines
+# label_density -- fraction of lines that define a label
+# variable_density -- fraction of A-instructions that refer to a variable
+# comment_ratio -- fraction of lines that are comments (half of them full
+#                  line comments, half trailing an instruction)
+# the rest of the A-instructions refer to labels or constants, and the rest
+# of the lines are C-instructions. labels are only referenced if their
+# address fits in an A-instruction
+def generate_program(num_lines, label_density=0.05, variable_density=0.3, comment_ratio=0.2, seed=0):
+    rng = random.Random(seed)
+    computations = list(Code.COMPUTATIONS.keys())
+    destinations = list(Code.DESTINATIONS.keys())
+    jumps = list(Code.JUMPS.keys())
+    num_variables = max(1, min(1024, num_lines // 100))
+
+    # lay the program out first so every label's address is known
+    kinds = []
+    labels = []
+    rom_addr = 0
+    for i in range(num_lines):
+        r = rng.random()
+        if r < comment_ratio / 2:
+            kinds.append("comment")
+        elif r < comment_ratio / 2 + label_density:
+            kinds.append("label")
+            if rom_addr <= MAX_LABEL_ADDRESS:
+                labels.append("LABEL_{}".format(len(labels)))
+            else:
+                labels.append(None)
+        else:
+            kinds.append("a" if rng.random() < 0.5 else "c")
+            rom_addr += 1
+    addressable = [label for label in labels if label is not None]
+
+    lines = []
+    label_iter = iter(labels)
+    unreferenced = 0
+    for kind in kinds:
+        if kind == "comment":
+            lines.append("// synthetic comment line")
+            continue
+        if kind == "label":
+            label = next(label_iter)
+            if label is None:
+                label = "UNREFERENCED_{}".format(unreferenced)
+                unreferenced += 1
+            lines.append("({})".format(label))
+            continue
+        if kind == "a":
+            r = rng.random()
+            if r < variable_density:
+                line = "@var_{}".format(rng.randrange(num_variables))
+            elif addressable and r < variable_density + (1 - variable_density) / 2:
+                line = "@{}".format(rng.choice(addressable))
+            else:
+                line = "@{}".format(rng.randrange(32768))
+        else:
+            line = rng.choice(computations)
+            if rng.random() < 0.7:
+                line = "{}={}".format(rng.choice(destinations[1:]), line)
+            if rng.random() < 0.2:
+                line = "{};{}".format(line, rng.choice(jumps[1:]))
+        if rng.random() < comment_ratio / 2:
+            line = "{} // trailing comment".format(line)
+        lines.append("    {}".format(line))
+    return ["{}\n".format(line) for line in lines]
+
+# time each phase of assembling lines, returns (phases, number of words)
+def time_phases(lines, format):
+    phases = {}
+    start = time.perf_counter()
+    instructions = list(Parser(lines))
+    phases["parse"] = time.perf_counter() - start
+
+    symbol_table = SymbolTable()
+    memory = MemoryWriter()
+    start = time.perf_counter()
+    fixups = encode_instructions(instructions, memory, symbol_table, rom_size=ROM_SIZE)
+    phases["first_pass"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    resolve_fixups(fixups, memory, symbol_table)
+    phases["second_pass"] = time.perf_counter() - start
+
+    (extension, writer_factory) = FORMATS[format]
+    start = time.perf_counter()
+    with tempfile.TemporaryFile() as out_f:
+        writer = writer_factory(out_f)
+        for word in memory.words:
+            writer.write(word)
+        writer.finish()
+    phases["write"] = time.perf_counter() - start
+    return (phases, len(memory.words))
+
+# benchmark a single program. the end to end time is the best of repeat
+# runs of assemble_file, peak memory is measured in a separate run
+def run_benchmark(name, lines, format, repeat):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        infile = os.path.join(tmpdir, "{}.asm".format(name))
+        with open(infile, "w") as f:
+            f.writelines(lines)
+
+        best = None
+        for i in range(repeat):
+            start = time.perf_counter()
+            assembler.assemble_file(infile, format, rom_size=ROM_SIZE)
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best:
+                best = elapsed
+
+        tracemalloc.start()
+        assembler.assemble_file(infile, format, rom_size=ROM_SIZE)
+        (current, peak) = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    phase_runs = [time_phases(lines, format) for i in range(repeat)]
+    phases = {phase: min(run[0][phase] for run in phase_runs) for phase in phase_runs[0][0]}
+    return {
+        "name": name,
+        "lines": len(lines),
+        "words": phase_runs[0][1],
+        "seconds": best,
+        "lines_per_sec": len(lines) / best if best > 0 else None,
+        "peak_memory_bytes": peak,
+        "phases": phases,
+    }
+
+def main(sizes, label_density, variable_density, comment_ratio, seed, repeat, format, real, output):
+    results = []
+    for size in sizes:
+        lines = generate_program(size, label_density, variable_density, comment_ratio, seed)
+        results.append(run_benchmark("synthetic_{}".format(size), lines, format, repeat))
+    if real:
+        for infile in sorted(glob.glob(os.path.join(TEST_PROGRAMS, "*", "*.asm"))):
+            with open(infile) as f:
+                lines = f.readlines()
+            name = os.path.splitext(os.path.basename(infile))[0]
+            results.append(run_benchmark(name, lines, format, repeat))
+
+    report = {
+        "assembler_version": assembler.ASSEMBLER_VERSION,
+        "python": platform.python_version(),
+        "format": format,
+        "repeat": repeat,
+        "parameters": {
+            "label_density": label_density,
+            "variable_density": variable_density,
+            "comment_ratio": comment_ratio,
+            "seed": seed,
+        },
+        "results": results,
+    }
+    if output is None:
+        print(json.dumps(report, indent=2))
+    else:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="benchmark the assembler on synthetic and real programs")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[1000, 10000, 100000],
+                        help="number of lines of each synthetic program")
+    parser.add_argument("--label-density", type=float, default=0.05, help="fraction of lines defining a label")
+    parser.add_argument("--variable-density", type=float, default=0.3, help="fraction of A-instructions referring to a variable")
+    parser.add_argument("--comment-ratio", type=float, default=0.2, help="fraction of lines that are comments")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic program generator")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per program, the fastest is reported")
+    parser.add_argument("--format", choices=FORMATS.keys(), default="hack", help="output format")
+    parser.add_argument("--no-real", dest="real", action="store_false", help="skip the programs in test_programs")
+    parser.add_argument("--output", default=None, help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+    main(args.sizes, args.label_density, args.variable_density, args.comment_ratio, args.seed,
+         args.repeat, args.format, args.real, args.output)
@@ -0,0 +1,137 @@
+import io
+import sys
+import time
+
+from .code import Code
+from .hack_writer import MemoryWriter
+from .parse_error import ParseError
+from .parser import Parser
+from .peephole import PeepholeOptimizer
+from .rom_report import ROM_SIZE
+from .symbol_map import SymbolMap
+from .symbol_table import SymbolTable
+
+# helper function to make sure a resolved symbol fits in an a instruction
+def check_address(symbol, address):
+    if address < 0 or address > 32767:
+        raise ParseError(symbol, "Address {} of symbol {} does not fit in an A-instruction".format(address, symbol))
+    return address
+
+# first pass: encode an iterable of decoded instructions, streaming the
+# encoded words to writer and adding labels to symbol_table.
+# A-instructions referring to symbols that are not known yet (forward label
+# references or variables) are written as a placeholder word, and the rom
+# address of the placeholder is recorded as a fixup for that symbol.
+# fails as soon as the program grows beyond rom_size words (None for no limit).
+# returns the fixups as a dict of symbol -> list of rom addresses
+def encode_instructions(instructions, writer, symbol_table, stats=None, rom_size=ROM_SIZE):
+    c_encodings = Code.ENCODINGS
+    fixups = {}
+    a_instructions = 0
+    l_instructions = 0
+    limit = rom_size if rom_size is not None else sys.maxsize
+    for instruction in instructions:
+        if instruction.kind != Parser.L_COMMAND and writer.size >= limit:
+            expression = "line {}".format(instruction.line_num) if instruction.line_num is not None else writer.size
+            raise ParseError(expression,
+                             "Program does not fit in ROM, it has more than {} instructions".format(limit),
+                             instruction.line_num)
+        if instruction.kind == Parser.A_COMMAND:
+            a_instructions += 1
+            symbol = instruction.symbol
+            if isinstance(symbol, int):
+                # the symbol is a constant, translate it
+                writer.write(symbol)
+            elif symbol_table.contains(symbol):
+                writer.write(check_address(symbol, symbol_table.get_address(symbol)))
+            else:
+                # not known yet, leave a placeholder to backpatch
+                fixups.setdefault(symbol, []).append(writer.size)
+                writer.write(0)
+        elif instruction.kind == Parser.C_COMMAND:
+            # Translate C command, straight from the precomputed table
+            writer.write(c_encodings[(instruction.comp, instruction.dest, instruction.jump)])
+        else:
+            symbol = instruction.symbol
+            if symbol_table.contains(symbol):
+                raise ParseError(symbol, "Symbol {} is already defined".format(symbol), instruction.line_num)
+            symbol_table.add_entry(symbol, writer.size)
+            l_instructions += 1
+
+    if stats is not None:
+        stats.a_instructions = a_instructions
+        stats.c_instructions = writer.size - a_instructions
+        stats.l_instructions = l_instructions
+    return fixups
+
+# second pass: backpatch the fixups. any symbol still unresolved that was
+# never defined as a label is a variable, allocated from ram 16 upward in
+# order of first reference
+def resolve_fixups(fixups, writer, symbol_table, stats=None):
+    ram_addr = 16
+    patches = []
+    for symbol, rom_addrs in fixups.items():
+        if not symbol_table.contains(symbol):
+            symbol_table.add_entry(symbol, ram_addr, SymbolTable.K_VARIABLE)
+            ram_addr += 1
+        address = check_address(symbol, symbol_table.get_address(symbol))
+        patches.extend((rom_addr, address) for rom_addr in rom_addrs)
+
+    # patch in output order so the writer seeks forward through the file
+    patches.sort()
+    for rom_addr, address in patches:
+        writer.patch(rom_addr, address)
+
+    if stats is not None:
+        stats.variables = ram_addr - 16
+        stats.symbols = len(symbol_table.entries())
+
+# assemble an iterable of decoded instructions in a single pass over the
+# input, streaming the encoded words to writer. only the symbol table and
+# the fixups are kept in memory. returns the symbol table.
+# if stats is given, it is filled with instruction counts and the time of
+# each pass. instructions are parsed lazily, so the first pass includes parsing.
+# with optimize, the instructions are read into a list and run through the
+# peephole optimizer first.
+# if symbol_map is given, the source line of every word and the symbols of
+# the program are recorded in it
+def assemble_instructions(instructions, writer, stats=None, optimize=False, rom_size=ROM_SIZE, symbol_map=None):
+    symbol_table = SymbolTable()
+    start = time.perf_counter()
+    if optimize:
+        optimizer = PeepholeOptimizer()
+        instructions = optimizer.optimize(list(instructions))
+        if stats is not None:
+            stats.removed = optimizer.removed
+            stats.timings["peephole (parse and optimize)"] = time.perf_counter() - start
+            start = time.perf_counter()
+    if symbol_map is not None:
+        instructions = symbol_map.record_lines(instructions)
+    fixups = encode_instructions(instructions, writer, symbol_table, stats, rom_size)
+    first_pass = time.perf_counter()
+    resolve_fixups(fixups, writer, symbol_table, stats)
+    second_pass = time.perf_counter()
+    writer.finish()
+    if symbol_map is not None:
+        symbol_map.add_symbols(symbol_table)
+    if stats is not None:
+        stats.words = writer.size
+        stats.labels = symbol_table.entries(SymbolTable.K_LABEL)
+        stats.timings["first pass (parse and encode)"] = first_pass - start
+        stats.timings["second pass (resolve fixups)"] = second_pass - first_pass
+        stats.timings["finish output"] = time.perf_counter() - second_pass
+    return symbol_table
+
+# assemble source in memory, without touching the file system.
+# source is the program text, or an iterable of lines (e.g. an open file or
+# the output of a code generator). name is the source name recorded in the
+# symbol map. errors are raised as ParseError, with the line number of the
+# offending line when it is known.
+# returns (words, symbol map), words is an array('H') of the encoded program
+def assemble(source, optimize=False, rom_size=ROM_SIZE, name="<source>"):
+    if isinstance(source, str):
+        source = io.StringIO(source)
+    writer = MemoryWriter()
+    symbol_map = SymbolMap(name)
+    assemble_instructions(Parser(source), writer, optimize=optimize, rom_size=rom_size, symbol_map=symbol_map)
+    return (writer.words, symbol_map)
@@ -0,0 +1,231 @@
+import hashlib
+import os
+import pickle
+import shutil
+import zlib
+from array import array
+
+from .code import Code
+from .parse_error import ParseError
+from .parser import Parser
+from .rom_report import ROM_SIZE
+from .symbol_table import SymbolTable
+
+class Chunk():
+    """Relocatable encoding of a region of assembly source.
+
+    Attributes:
+        digest -- hash of the source lines of the region
+        words -- encoded words, A-instructions referring to labels or variables hold a placeholder
+        relocations -- (offset, symbol) of every placeholder in words
+        labels -- (symbol, offset) of every label defined in the region
+    """
+    __slots__ = ("digest", "words", "relocations", "labels")
+
+    def __init__(self, digest, words, relocations, labels):
+        self.digest = digest
+        self.words = words
+        self.relocations = relocations
+        self.labels = labels
+
+class AssemblyCache():
+    """On-disk cache of assembler output, keyed by content.
+
+    Complete outputs are stored under a hash of the assembler version, the
+    output options and the contents of the input file, so an unchanged file
+    is never assembled twice.
+
+    For incremental assembly, a file is split into regions at labels whose
+    name hashes to a multiple of BOUNDARY_MODULUS. The boundaries only depend
+    on the surrounding source, so an edit changes the regions it touches and
+    leaves the others alone. Every region is encoded into a relocatable Chunk
+    and the chunks of a file are stored as its index. When the file is
+    assembled again, only regions that are not in the index are encoded.
+    The chunks are then linked: label addresses are recomputed from the
+    chunk sizes and labels, and placeholders are resolved.
+
+    Attributes:
+        _cache_dir -- directory holding the cache
+        _version -- assembler version, entries of other versions are never used
+        _parser -- parser used to decode changed regions
+    """
+    BOUNDARY_MODULUS = 32
+    READ_BLOCK_SIZE = 1 << 16
+
+    def __init__(self, cache_dir, version):
+        self._cache_dir = cache_dir
+        self._version = version
+        self._parser = Parser([])
+
+    # return the path of a cache entry, creating its directory if needed
+    def _path(self, kind, name):
+        directory = os.path.join(self._cache_dir, kind)
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, name)
+
+    # helper function to add the contents of a file to a hash, returns the hash
+    def _hash_file(self, digest, path):
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(self.READ_BLOCK_SIZE), b""):
+                digest.update(block)
+        return digest
+
+    # return the cache key of the output of infile assembled with options
+    # (output format and any flag that changes the output)
+    def key(self, infile, *options):
+        digest = hashlib.sha256("\0".join((self._version,) + options + ("",)).encode("utf-8"))
+        return self._hash_file(digest, infile).hexdigest()
+
+    # copy the cached output for key to outfile. returns false if it is not
+    # cached, or if any file included by the source changed since
+    def fetch(self, key, outfile):
+        try:
+            with open(self._path("dependencies", key), "rb") as f:
+                dependencies = pickle.load(f)
+        except FileNotFoundError:
+            dependencies = []
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            return False
+        for (path, digest) in dependencies:
+            try:
+                if self._hash_file(hashlib.sha256(), path).hexdigest() != digest:
+                    return False
+            except OSError:
+                return False
+        try:
+            shutil.copyfile(self._path("outputs", key), outfile)
+        except FileNotFoundError:
+            return False
+        return True
+
+    # store outfile as the output for key. dependencies are the paths of the
+    # files included by the source, the output is only used while they are unchanged
+    def store(self, key, outfile, dependencies=()):
+        path = self._path("dependencies", key)
+        if dependencies:
+            tmpfile = "{}.{}.tmp".format(path, os.getpid())
+            with open(tmpfile, "wb") as f:
+                pickle.dump([(dependency, self._hash_file(hashlib.sha256(), dependency).hexdigest())
+                             for dependency in dependencies], f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmpfile, path)
+        elif os.path.exists(path):
+            os.remove(path)
+        path = self._path("outputs", key)
+        tmpfile = "{}.{}.tmp".format(path, os.getpid())
+        shutil.copyfile(outfile, tmpfile)
+        os.replace(tmpfile, path)
+
+    # split lines into regions, a region ends before a boundary label.
+    # regions are not relocatable if the source uses .include or .macro,
+    # then None is yielded and the split stops
+    def split(self, lines):
+        region = []
+        for line in lines:
+            instruction = self._parser.remove_whitespace(line)
+            if instruction[:1] == ".":
+                yield None
+                return
+            if region and instruction[:1] == "(" and zlib.crc32(instruction.encode("utf-8")) % self.BOUNDARY_MODULUS == 0:
+                yield region
+                region = []
+            region.append(line)
+        if region:
+            yield region
+
+    # encode a region of source lines into a relocatable chunk
+    # line_num is the line number of the first line of the region
+    def encode_chunk(self, digest, lines, line_num):
+        c_encodings = Code.ENCODINGS
+        predefined = SymbolTable.PREDEFINED_SYMBOLS
+        words = array('H')
+        relocations = []
+        labels = []
+        for line in lines:
+            instruction = self._parser.decode(line, line_num)
+            line_num += 1
+            if instruction is None:
+                continue
+            if instruction.kind == Parser.A_COMMAND:
+                symbol = instruction.symbol
+                if isinstance(symbol, int):
+                    words.append(symbol)
+                elif symbol in predefined:
+                    words.append(predefined[symbol])
+                else:
+                    relocations.append((len(words), symbol))
+                    words.append(0)
+            elif instruction.kind == Parser.C_COMMAND:
+                words.append(c_encodings[(instruction.comp, instruction.dest, instruction.jump)])
+            else:
+                labels.append((instruction.symbol, len(words)))
+        return Chunk(digest, words, relocations, labels)
+
+    # link chunks into a program, writing the words to writer. returns the symbol table
+    # variables are allocated from ram 16 upward in order of first reference.
+    # fails if the program needs more than rom_size words (None for no limit)
+    def link(self, chunks, writer, rom_size=ROM_SIZE):
+        symbol_table = SymbolTable()
+        rom_addr = 0
+        for chunk in chunks:
+            for (symbol, offset) in chunk.labels:
+                if symbol_table.contains(symbol):
+                    raise ParseError(symbol, "Symbol {} is already defined".format(symbol))
+                symbol_table.add_entry(symbol, rom_addr + offset)
+            rom_addr += len(chunk.words)
+        if rom_size is not None and rom_addr > rom_size:
+            raise ParseError(rom_addr, "Program does not fit in ROM, it has more than {} instructions".format(rom_size))
+
+        ram_addr = 16
+        for chunk in chunks:
+            words = array('H', chunk.words)
+            for (offset, symbol) in chunk.relocations:
+                if not symbol_table.contains(symbol):
+                    symbol_table.add_entry(symbol, ram_addr, SymbolTable.K_VARIABLE)
+                    ram_addr += 1
+                address = symbol_table.get_address(symbol)
+                if address > 32767:
+                    raise ParseError(symbol, "Address {} of symbol {} does not fit in an A-instruction".format(address, symbol))
+                words[offset] = address
+            for word in words:
+                writer.write(word)
+        writer.finish()
+        return symbol_table
+
+    # load the chunk index of infile as a dict of digest -> chunk
+    def _load_index(self, path):
+        try:
+            with open(path, "rb") as f:
+                (version, chunks) = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            return {}
+        if version != self._version:
+            return {}
+        return {chunk.digest: chunk for chunk in chunks}
+
+    def _store_index(self, path, chunks):
+        tmpfile = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmpfile, "wb") as f:
+            pickle.dump((self._version, chunks), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpfile, path)
+
+    # assemble infile, re-encoding only the regions that changed since it was
+    # last assembled. writes the words to writer and returns the symbol table.
+    # returns None without writing anything if the file uses directives
+    def assemble_incremental(self, infile, writer, rom_size=ROM_SIZE):
+        index_path = self._path("index", hashlib.sha256(os.path.abspath(infile).encode("utf-8")).hexdigest())
+        previous = self._load_index(index_path)
+        chunks = []
+        line_num = 1
+        with open(infile, buffering=self.READ_BLOCK_SIZE) as f:
+            for lines in self.split(f):
+                if lines is None:
+                    return None
+                digest = hashlib.sha256("".join(lines).encode("utf-8")).digest()
+                chunk = previous.get(digest)
+                if chunk is None:
+                    chunk = self.encode_chunk(digest, lines, line_num)
+                chunks.append(chunk)
+                line_num += len(lines)
+        symbol_table = self.link(chunks, writer, rom_size)
+        self._store_index(index_path, chunks)
+        return symbol_table
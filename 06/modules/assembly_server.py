@@ -0,0 +1,110 @@
+import json
+import os
+import socket
+import socketserver
+import stat
+
+from .parse_error import ParseError
+
+class AssemblyRequestHandler(socketserver.StreamRequestHandler):
+    """Handles the assemble requests of one client connection.
+
+    A request is a single line of JSON, the source is given either inline or
+    as the path of an .asm file readable by the server:
+
+        {"source": "@2\\nD=A\\n", "format": "hack", "optimize": false}
+        {"path": "/abs/path/Prog.asm", "format": "bin-le"}
+
+    format and optimize are optional (default "hack" and false). Every request
+    is answered with a line of JSON, followed by the output if it succeeded:
+
+        {"ok": true, "words": 2, "length": 34}\\n<34 bytes of output>
+        {"ok": false, "expression": "...", "message": "...", "line": 3}\\n
+
+    line is only given for errors in the source, and may be null.
+
+    A client can send any number of requests over the same connection.
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("request is not a JSON object")
+                (words, output) = self.server.assemble_request(request)
+            except ParseError as err:
+                self.send({"ok": False, "expression": str(err.expression), "message": err.message, "line": err.line_num})
+            except OSError as err:
+                self.send({"ok": False, "expression": request.get("path"), "message": str(err)})
+            except (ValueError, KeyError, TypeError) as err:
+                self.send({"ok": False, "expression": line.decode("utf-8", "replace").strip(),
+                           "message": "Invalid request: {}".format(err)})
+            else:
+                self.send({"ok": True, "words": words, "length": len(output)}, output)
+
+    # send a response header, followed by the output if any
+    def send(self, header, output=b""):
+        self.wfile.write(json.dumps(header).encode("utf-8") + b"\n")
+        self.wfile.write(output)
+        self.wfile.flush()
+
+class AssemblyServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Assembler daemon listening on a unix domain socket.
+
+    Keeps the interpreter and the assembler modules loaded, so a request only
+    pays for the assembly itself. Every connection is served in its own thread.
+
+    Only a socket left behind by a server that did not shut down cleanly is
+    replaced. Any other file at the path, or a socket another server is
+    still listening on, is refused with an OSError. On the way out only the
+    socket this server created is removed.
+
+    Attributes:
+        socket_path -- path of the unix domain socket
+        assemble_request -- function taking a request dict and returning
+                            (number of words, output bytes)
+        _socket_ino -- inode of the socket this server created, None until bound
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path, assemble_request):
+        self.socket_path = socket_path
+        self.assemble_request = assemble_request
+        self._socket_ino = None
+        self._remove_stale_socket()
+        super().__init__(socket_path, AssemblyRequestHandler)
+
+    # remove a socket left behind by a server that did not shut down cleanly,
+    # raises OSError if the path is anything else or a server is listening on it
+    def _remove_stale_socket(self):
+        try:
+            mode = os.lstat(self.socket_path).st_mode
+        except FileNotFoundError:
+            return
+        if not stat.S_ISSOCK(mode):
+            raise OSError("{} exists and is not a socket".format(self.socket_path))
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(self.socket_path)
+            except OSError:
+                os.remove(self.socket_path)
+                return
+        raise OSError("a server is already listening on {}".format(self.socket_path))
+
+    def server_bind(self):
+        super().server_bind()
+        self._socket_ino = os.lstat(self.socket_path).st_ino
+
+    def server_close(self):
+        super().server_close()
+        if self._socket_ino is None:
+            return
+        try:
+            if os.lstat(self.socket_path).st_ino == self._socket_ino:
+                os.remove(self.socket_path)
+        except FileNotFoundError:
+            pass
+        self._socket_ino = None
@@ -0,0 +1,43 @@
+class AssemblyStats():
+    """Statistics collected while assembling a program.
+
+    Attributes:
+        a_instructions -- number of A-instructions
+        c_instructions -- number of C-instructions
+        l_instructions -- number of labels
+        variables -- number of variables allocated from ram 16 upward
+        symbols -- number of symbols in the symbol table, without the predefined symbols
+        removed -- number of instructions removed by the peephole optimizer
+        words -- number of words of the program
+        labels -- dict of label -> rom address
+        timings -- wall time in seconds of each pass, in the order they ran
+    """
+
+    def __init__(self):
+        self.a_instructions = 0
+        self.c_instructions = 0
+        self.l_instructions = 0
+        self.variables = 0
+        self.symbols = 0
+        self.removed = 0
+        self.words = 0
+        self.labels = {}
+        self.timings = {}
+
+    # return the statistics as printable lines
+    def report(self):
+        lines = [
+            "A-instructions: {}".format(self.a_instructions),
+            "C-instructions: {}".format(self.c_instructions),
+            "L-instructions: {}".format(self.l_instructions),
+        ]
+        if self.variables:
+            lines.append("variables: {} (RAM 16-{})".format(self.variables, 15 + self.variables))
+        else:
+            lines.append("variables: 0")
+        lines.append("symbol table size: {}".format(self.symbols))
+        if self.removed:
+            lines.append("removed by peephole optimizer: {}".format(self.removed))
+        for (name, seconds) in self.timings.items():
+            lines.append("{}: {:.4f}s".format(name, seconds))
+        return lines
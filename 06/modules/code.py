@@ -2,10 +2,14 @@ class Code():
     """
     Class responsible for converting c-command nmeumonics to binary strings
 
+    The encoder looks a c-command up in ENCODINGS, built once from the bits
+    of every mnemonic.
+
     Attributes:
-        _dest -- destination
-        _comp -- computation
-        _jump -- jump
+        DESTINATIONS -- bits of every dest mnemonic
+        JUMPS -- bits of every jump mnemonic
+        COMPUTATIONS -- bits of every comp mnemonic
+        ENCODINGS -- encoded word of every c-command, keyed by (comp, dest, jump)
     """
     DESTINATIONS = {
         "null": "000",
@@ -60,16 +64,13 @@ class Code():
         "D|M": "1010101",
     }
 
-    def __init__(self, comp, dest, jump):
-        self._dest = dest
-        self._comp = comp
-        self._jump = jump
-    
-    def dest(self):
-        return self.DESTINATIONS[self._dest]
-    
-    def comp(self):
-        return self.COMPUTATIONS[self._comp]
-    
-    def jump(self):
-        return self.JUMPS[self._jump]
\ No newline at end of file
+    # encoded word of every valid c-command keyed by (comp, dest, jump)
+    # built once below, after the class is defined
+    ENCODINGS = {}
+
+Code.ENCODINGS.update(
+    ((comp, dest, jump), int("111{}{}{}".format(comp_bits, dest_bits, jump_bits), 2))
+    for comp, comp_bits in Code.COMPUTATIONS.items()
+    for dest, dest_bits in Code.DESTINATIONS.items()
+    for jump, jump_bits in Code.JUMPS.items()
+)
@@ -0,0 +1,235 @@
+import io
+import sys
+from array import array
+
+class LineCache(dict):
+    """Lazily filled mapping of a word to its encoded output line.
+
+    Attributes:
+        _encode -- function encoding a single word, called once per distinct word
+    """
+
+    def __init__(self, encode):
+        super().__init__()
+        self._encode = encode
+
+    def __missing__(self, word):
+        line = self._encode(word)
+        self[word] = line
+        return line
+
+class WordWriter():
+    """Base class for writers streaming encoded words to a rom image.
+
+    Words are buffered in chunks before they are handed to the file. Every
+    word is stored at a position in the file that can be computed from its
+    address, so a word that has already been written can be backpatched in
+    place by seeking to it. Subclasses implement encode() and offset().
+
+    Attributes:
+        _fd -- binary file object opened for writing, must support seek
+        _chunk -- words not yet handed to _fd
+        _size -- number of words written so far, including _chunk
+        _patched -- true if _fd is not positioned at the end of the output
+    """
+    CHUNK_SIZE = 4096
+
+    def __init__(self, fd):
+        self._fd = fd
+        self._chunk = []
+        self._size = 0
+        self._patched = False
+
+    # number of words written so far
+    @property
+    def size(self):
+        return self._size
+
+    # encode a list of words starting at address into the bytes that represent them
+    def encode(self, words, address):
+        raise NotImplementedError
+
+    # return the position in the file of the word at address
+    def offset(self, address):
+        raise NotImplementedError
+
+    # append a word to the output
+    def write(self, word):
+        self._chunk.append(word)
+        self._size += 1
+        if len(self._chunk) >= self.CHUNK_SIZE:
+            self.flush()
+
+    # replace the word at address, which must already have been written
+    def patch(self, address, word):
+        if address < 0 or address >= self._size:
+            raise IndexError("Cannot patch word {}, only {} words written".format(address, self._size))
+        start = self._size - len(self._chunk)
+        if address >= start:
+            # still buffered, patch it in memory
+            self._chunk[address - start] = word
+            return
+        self.flush()
+        self._fd.seek(self.offset(address))
+        self._write_patch(address, word)
+        self._patched = True
+
+    # write the patched word at address, _fd is positioned at offset(address)
+    def _write_patch(self, address, word):
+        self._fd.write(self.encode([word], address))
+
+    # hand any buffered words to the file
+    def flush(self):
+        if self._patched:
+            self._fd.seek(0, io.SEEK_END)
+            self._patched = False
+        if self._chunk:
+            self._fd.write(self.encode(self._chunk, self._size - len(self._chunk)))
+            self._chunk = []
+
+    # flush and write anything that has to follow the last word
+    def finish(self):
+        self.flush()
+
+class MemoryWriter(WordWriter):
+    """Writer class collecting encoded words in memory instead of a file.
+
+    Attributes:
+        words -- the words written so far (array of uint16)
+    """
+
+    def __init__(self):
+        super().__init__(None)
+        self.words = array('H')
+
+    def write(self, word):
+        self.words.append(word)
+        self._size += 1
+
+    def patch(self, address, word):
+        self.words[address] = word
+
+    def flush(self):
+        pass
+
+class HackWriter(WordWriter):
+    """Writer class responsible for streaming encoded words to a .hack file.
+
+    Each word is written as a line of 16 binary digits.
+
+    Attributes:
+        _lines -- cache of encoded lines, programs reuse a small set of words
+    """
+    WORD_SIZE = 17
+
+    def __init__(self, fd):
+        super().__init__(fd)
+        self._lines = LineCache(self.encode_word)
+
+    # encode a single word into the bytes that represent it in the output
+    def encode_word(self, word):
+        return "{:016b}\n".format(word).encode("ascii")
+
+    def encode(self, words, address):
+        return b"".join(map(self._lines.__getitem__, words))
+
+    def offset(self, address):
+        return address * self.WORD_SIZE
+
+class BinaryWriter(WordWriter):
+    """Writer class responsible for streaming encoded words as raw uint16 values.
+
+    Attributes:
+        _swap -- true if byteorder differs from the native byte order
+    """
+    WORD_SIZE = 2
+
+    def __init__(self, fd, byteorder):
+        super().__init__(fd)
+        self._swap = byteorder != sys.byteorder
+
+    def encode(self, words, address):
+        packed = array('H', words)
+        if self._swap:
+            packed.byteswap()
+        return packed.tobytes()
+
+    def offset(self, address):
+        return address * self.WORD_SIZE
+
+class IntelHexWriter(WordWriter):
+    """Writer class responsible for streaming encoded words as Intel HEX records.
+
+    Words are stored little-endian at byte address 2 * rom address, in data
+    records of RECORD_WORDS words each. An extended linear address record
+    precedes every 64K byte segment after the first, and an end of file
+    record is written by finish(). Only complete records are flushed before
+    finish(), which keeps every record at a fixed position for backpatching.
+    Patching reads the record back, so _fd must also be readable.
+    """
+    RECORD_WORDS = 8
+    RECORD_SIZE = 44                # ":10AAAA00" + 32 data digits + checksum + "\n"
+    SEGMENT_WORDS = 0x8000          # words per 64K byte segment
+    SEGMENT_RECORD_SIZE = 16        # ":02000004SSSS" + checksum + "\n"
+
+    # format a single record
+    def record(self, record_type, address, data):
+        fields = bytes([len(data), address >> 8, address & 0xFF, record_type]) + data
+        checksum = -sum(fields) & 0xFF
+        return ":{}{:02X}\n".format(fields.hex().upper(), checksum).encode("ascii")
+
+    def encode(self, words, address):
+        records = []
+        for i in range(0, len(words), self.RECORD_WORDS):
+            word_addr = address + i
+            if word_addr % self.SEGMENT_WORDS == 0 and word_addr > 0:
+                segment = word_addr // self.SEGMENT_WORDS
+                records.append(self.record(4, 0, bytes([segment >> 8, segment & 0xFF])))
+            data = array('H', words[i:i + self.RECORD_WORDS])
+            if sys.byteorder != "little":
+                data.byteswap()
+            records.append(self.record(0, (word_addr * 2) & 0xFFFF, data.tobytes()))
+        return b"".join(records)
+
+    # position of the record holding the word at address
+    def offset(self, address):
+        record_num = address // self.RECORD_WORDS
+        segment = address // self.SEGMENT_WORDS
+        return record_num * self.RECORD_SIZE + segment * self.SEGMENT_RECORD_SIZE
+
+    def _write_patch(self, address, word):
+        record = self._fd.read(self.RECORD_SIZE)
+        data = array('H', bytes.fromhex(record[9:41].decode("ascii")))
+        if sys.byteorder != "little":
+            data.byteswap()
+        record_addr = address - address % self.RECORD_WORDS
+        words = data.tolist()
+        words[address - record_addr] = word
+        self._fd.seek(self.offset(address))
+        # re-encode without a segment record, _fd is positioned at the data record itself
+        self._fd.write(self.encode(words, record_addr)[-self.RECORD_SIZE:])
+
+    def flush(self):
+        # only complete records, the rest stays buffered until finish()
+        complete = len(self._chunk) - len(self._chunk) % self.RECORD_WORDS
+        remainder = self._chunk[complete:]
+        self._chunk = self._chunk[:complete]
+        self._size -= len(remainder)
+        super().flush()
+        self._chunk = remainder
+        self._size += len(remainder)
+
+    def finish(self):
+        super().flush()
+        if self._chunk:
+            self._fd.write(self.encode(self._chunk, self._size - len(self._chunk)))
+            self._chunk = []
+        self._fd.write(self.record(1, 0, b""))
+
+# output formats supported by the assembler: format -> (file extension, writer factory)
+FORMATS = {
+    "hack": (".hack", HackWriter),
+    "bin-le": (".bin", lambda fd: BinaryWriter(fd, "little")),
+    "bin-be": (".bin", lambda fd: BinaryWriter(fd, "big")),
+    "ihex": (".hex", IntelHexWriter),
+}
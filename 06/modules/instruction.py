@@ -0,0 +1,30 @@
+class Instruction():
+    """Immutable record of a single decoded assembly instruction.
+
+    Attributes:
+        kind -- command type (Parser.A_COMMAND, Parser.C_COMMAND or Parser.L_COMMAND)
+        symbol -- label or variable name, or the integer value of a constant A-instruction
+        dest -- destination of a C-instruction
+        comp -- computation of a C-instruction
+        jump -- jump of a C-instruction
+        line_num -- line number of the instruction in the source (starting at 1)
+    """
+    __slots__ = ("kind", "symbol", "dest", "comp", "jump", "line_num")
+
+    def __init__(self, kind, symbol=None, dest=None, comp=None, jump=None, line_num=None):
+        object.__setattr__(self, "kind", kind)
+        object.__setattr__(self, "symbol", symbol)
+        object.__setattr__(self, "dest", dest)
+        object.__setattr__(self, "comp", comp)
+        object.__setattr__(self, "jump", jump)
+        object.__setattr__(self, "line_num", line_num)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Instruction is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("Instruction is immutable")
+
+    def __repr__(self):
+        return "Instruction({}, symbol={!r}, dest={!r}, comp={!r}, jump={!r}, line_num={})".format(
+            self.kind, self.symbol, self.dest, self.comp, self.jump, self.line_num)
@@ -4,8 +4,10 @@ class ParseError(Exception):
     Attributes:
         expression -- input expression in which the error occurred
         message -- explanation of the error
+        line_num -- line number (starting at 1) of the expression in the source, None if unknown
     """
 
-    def __init__(self, expression, message):
+    def __init__(self, expression, message, line_num=None):
         self.expression = expression
-        self.message = message
\ No newline at end of file
+        self.message = message
+        self.line_num = line_num
@@ -1,13 +1,41 @@
+import os
 import re
+from .instruction import Instruction
 from .parse_error import ParseError
 
 class Parser():
     """Parser class responsible for parsing assembly commands.
 
+    Iterating the parser also expands two directives:
+
+        .include "lib.asm"      includes the file once, later includes of the
+                                same file are ignored. the path is relative
+                                to the including file
+        .macro NAME p1, p2      defines a macro up to the next .endmacro line.
+        ...                     {p1} in its body is replaced by the argument,
+        .endmacro               {@} by a number unique to the expansion
+        NAME a1, a2             expands the macro
+
+    A macro that defines labels must make them unique with {@}, e.g.
+    (SKIP{@}) and @SKIP{@}, or it can only be expanded once.
+
+    Instructions from an included file or a macro expansion take the line
+    number of the directive in the source. Included files are decoded once
+    per process, and the expansion of every macro once per arguments,
+    except for expansions that use {@}.
+
     Attributes:
-        _input -- list of assembly commands, one line per list element
-        _numlines -- number of assembly commands
+        _input -- assembly commands, one line per element. iterating the parser
+                  works on any iterable of lines (e.g. an open file), the
+                  advance() cursor api needs a list
         _index -- current index of instruction in _input
+        _current -- decoded Instruction at _index, None for an empty line
+        _directory -- directory includes of the source are relative to
+        _macros -- dict of macro name -> (parameters, body lines, body uses {@})
+        _expansions -- dict of (macro name, arguments) -> expanded instructions
+        _depth -- number of macro expansions in progress
+        _expansion_id -- number of the last expansion that used {@}
+        includes -- absolute paths of the files included so far
     """
     A_COMMAND = "A_COMMAND"
     C_COMMAND = "C_COMMAND"
@@ -67,120 +95,324 @@ class Parser():
         "D|M",
     ]
 
-    def __init__(self, input):
+    # compiled once, matched against instructions with whitespace and comments removed
+    A_CONSTANT_PATTERN = re.compile(r"@([0-9]+)$")
+    A_SYMBOL_PATTERN = re.compile(r"@([a-zA-Z][a-zA-Z0-9_\.\$\:]*)$")
+    L_PATTERN = re.compile(r"\(([a-zA-Z_\.\$\:][a-zA-Z0-9_\.\$\:]*)\)$")
+
+    # directives, and the items of a line that is not an instruction
+    INCLUDE = ".include"
+    MACRO = ".macro"
+    END_MACRO = ".endmacro"
+    INVOKE = "invoke"
+    INCLUDE_PATTERN = re.compile(r'"([^"]+)"$')
+    MACRO_NAME_PATTERN = re.compile(r"[a-zA-Z_][a-zA-Z0-9_]*$")
+    MACRO_PARAM_PATTERN = re.compile(r"\{(@|[a-zA-Z_][a-zA-Z0-9_]*)\}")
+    EXPANSION_ID = "@"
+    MAX_EXPANSION_DEPTH = 64
+
+    # decoded included files, shared by all parsers so a library included by
+    # every file of a build is only read once. abspath -> ((mtime, size), items)
+    _included_files = {}
+
+    def __init__(self, input, path=None):
         self._input = input
-        self._numlines = len(self._input)
         self._index = -1
+        self._current = None
+        self._destinations = frozenset(self.DESTINATIONS)
+        self._jumps = frozenset(self.JUMPS)
+        self._computations = frozenset(self.COMPUTATIONS)
+        self._directory = os.path.dirname(path) if path is not None else ""
+        self._macros = {}
+        self._expansions = {}
+        self._depth = 0
+        self._expansion_id = 0
+        self.includes = []
+
+    # iterate over the decoded instructions, skipping empty lines and
+    # expanding includes and macros
+    def __iter__(self):
+        return self._items(self._input, self._directory)
+
+    # decode lines into items: Instructions, and tuples (kind, line_num, ...)
+    # for directives and macro invocations. the body of a macro definition is
+    # kept as lines. with a directory, the directives are expanded in place
+    # instead, relative to that directory
+    def _items(self, lines, directory=None):
+        definition = None
+        body = None
+        line_num = 0
+        for line in lines:
+            line_num += 1
+            if body is not None:
+                if self.remove_whitespace(line) == self.END_MACRO:
+                    if directory is None:
+                        yield definition + (tuple(body),)
+                    else:
+                        self._define(definition + (tuple(body),), definition[1])
+                    body = None
+                else:
+                    body.append(line)
+                continue
+            try:
+                instruction = self.decode(line, line_num)
+            except ParseError as err:
+                item = self._directive(line, line_num, err)
+                if item[0] == self.MACRO:
+                    (definition, body) = (item, [])
+                elif directory is None:
+                    yield item
+                else:
+                    yield from self._expand_item(item, directory, line_num)
+                continue
+            if instruction is not None:
+                yield instruction
+        if body is not None:
+            raise ParseError(definition[2], "Macro {} has no {}".format(definition[2], self.END_MACRO), definition[1])
+
+    # return the item of a line that failed to decode with err
+    def _directive(self, line, line_num, err):
+        words = line.split("//")[0].split(None, 1)
+        name = words[0]
+        rest = words[1].strip() if len(words) > 1 else ""
+        if name == self.INCLUDE:
+            match = self.INCLUDE_PATTERN.match(rest)
+            if not match:
+                raise ParseError(line.strip(), "File name of {} must be in double quotes".format(self.INCLUDE), line_num)
+            return (self.INCLUDE, line_num, match.group(1))
+        if name == self.MACRO:
+            words = rest.split(None, 1)
+            if not words or not self.MACRO_NAME_PATTERN.match(words[0]) or words[0] in self._computations:
+                raise ParseError(line.strip(), "Invalid macro name", line_num)
+            params = self._arguments(words[1] if len(words) > 1 else "")
+            for param in params:
+                if not self.MACRO_NAME_PATTERN.match(param):
+                    raise ParseError(line.strip(), "Invalid macro parameter {}".format(param), line_num)
+            return (self.MACRO, line_num, words[0], params)
+        if name.startswith("."):
+            raise ParseError(name, "Unknown directive", line_num)
+        if self.MACRO_NAME_PATTERN.match(name):
+            # an invocation, unless name turns out not to be a macro
+            return (self.INVOKE, line_num, name, self._arguments(rest), err)
+        raise err
+
+    # split comma separated macro arguments or parameters
+    def _arguments(self, text):
+        if not text:
+            return ()
+        return tuple(argument.strip() for argument in text.split(","))
+
+    # expand items into instructions, includes are relative to directory.
+    # line_num is given to every instruction, None to keep their own
+    def _expand(self, items, directory, line_num):
+        for item in items:
+            if item.__class__ is Instruction:
+                if line_num is None:
+                    yield item
+                else:
+                    yield self._renumber(item, line_num)
+                continue
+            yield from self._expand_item(item, directory, item[1] if line_num is None else line_num)
+
+    # expand a directive or macro invocation item at line_num
+    def _expand_item(self, item, directory, line_num):
+        if item[0] == self.INVOKE:
+            yield from self._invoke(item, line_num)
+        elif item[0] == self.INCLUDE:
+            yield from self._include(os.path.join(directory, item[2]), line_num)
+        else:
+            self._define(item, line_num)
+
+    def _define(self, item, line_num):
+        (kind, item_line, name, params, body) = item
+        if name in self._macros:
+            raise ParseError(name, "Macro {} is already defined".format(name), line_num)
+        unique = any("{" + self.EXPANSION_ID + "}" in line for line in body)
+        self._macros[name] = (params, body, unique)
+
+    # helper function to give an instruction the line number of a directive
+    def _renumber(self, instruction, line_num):
+        return Instruction(instruction.kind, instruction.symbol, instruction.dest, instruction.comp, instruction.jump,
+                           line_num)
+
+    # expand a macro invocation, expansions are cached by name and arguments.
+    # an expansion that took a number for {@}, itself or in a nested macro,
+    # is not cached, the next invocation needs labels of its own
+    def _invoke(self, item, line_num):
+        (kind, item_line, name, args, err) = item
+        key = (name, args)
+        expansion = self._expansions.get(key)
+        if expansion is None:
+            if name not in self._macros:
+                # not a macro, the line is an invalid instruction
+                raise ParseError(err.expression, err.message, line_num)
+            (params, body, unique) = self._macros[name]
+            if len(args) != len(params):
+                raise ParseError(name, "Macro {} takes {} arguments, {} given".format(name, len(params), len(args)), line_num)
+            values = dict(zip(params, args))
+            first_id = self._expansion_id
+            if unique:
+                self._expansion_id += 1
+                values[self.EXPANSION_ID] = str(self._expansion_id)
+
+            def substitute(match):
+                if match.group(1) not in values:
+                    raise ParseError(match.group(0), "Unknown macro parameter", line_num)
+                return values[match.group(1)]
+
+            if self._depth >= self.MAX_EXPANSION_DEPTH:
+                raise ParseError(name, "Macro expansion is nested too deeply", line_num)
+            self._depth += 1
+            try:
+                items = list(self._items([self.MACRO_PARAM_PATTERN.sub(substitute, line) for line in body]))
+                for body_item in items:
+                    if body_item.__class__ is not Instruction and body_item[0] != self.INVOKE:
+                        raise ParseError(name, "Macro {} cannot include files or define macros".format(name), line_num)
+                expansion = tuple(self._expand(items, self._directory, line_num))
+            except ParseError as err:
+                if self._depth > 1:
+                    raise
+                # name the macro invoked by the source line
+                raise ParseError(err.expression, "{} (in macro {})".format(err.message, name), line_num)
+            finally:
+                self._depth -= 1
+            if self._expansion_id == first_id:
+                self._expansions[key] = expansion
+        for instruction in expansion:
+            yield self._renumber(instruction, line_num)
+
+    # expand an included file, unless it was included before
+    def _include(self, path, line_num):
+        path = os.path.abspath(path)
+        if path in self.includes:
+            return
+        self.includes.append(path)
+        try:
+            stat = os.stat(path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+            cached = self._included_files.get(path)
+            if cached is not None and cached[0] == signature:
+                items = cached[1]
+            else:
+                with open(path) as f:
+                    items = tuple(self._items(f))
+                self._included_files[path] = (signature, items)
+            yield from self._expand(items, os.path.dirname(path), line_num)
+        except OSError as err:
+            raise ParseError(path, "Cannot read included file: {}".format(err.strerror), line_num)
+        except ParseError as err:
+            raise ParseError(err.expression, "{} (in {})".format(err.message, path), line_num)
     
     def remove_whitespace(self, line):
         temp = "".join(line.split())
         return temp.split("//")[0]
 
+    # decode a single line of assembly into an Instruction
+    # returns None for lines that are empty once whitespace and comments are removed
+    def decode(self, line, line_num=None):
+        instruction = self.remove_whitespace(line)
+        if instruction == "":
+            return None
+
+        if instruction[0] == "@":
+            match = self.A_CONSTANT_PATTERN.match(instruction)
+            if match:
+                value = int(match.group(1))
+                if value < 32768:
+                    return Instruction(self.A_COMMAND, symbol=value, line_num=line_num)
+                raise ParseError(instruction, "Invalid value in A-instruction: {}. Value must be between 0 and 32767 (inclusive)".format(value), line_num)
+            match = self.A_SYMBOL_PATTERN.match(instruction)
+            if match:
+                return Instruction(self.A_COMMAND, symbol=match.group(1), line_num=line_num)
+        elif instruction[0] == "(":
+            match = self.L_PATTERN.match(instruction)
+            if match:
+                return Instruction(self.L_COMMAND, symbol=match.group(1), line_num=line_num)
+
+        # anything else is a C-instruction: dest=comp;jump
+        # comp is the part between = and ;, dest and jump are optional
+        has_dest = "=" in instruction
+        has_jump = ";" in instruction
+        comp = instruction
+        if has_dest:
+            comp = comp.split("=")[1]
+        if has_jump:
+            comp = comp.split(";")[0]
+        if comp not in self._computations:
+            raise ParseError(instruction, "Invalid computation specified", line_num)
+
+        dest = "null"
+        if has_dest:
+            # destination is specified. make sure there is only one =
+            if instruction.count("=") != 1:
+                raise ParseError(instruction, "Multiple destinations specified", line_num)
+            dest = instruction.split("=")[0]
+            if dest not in self._destinations:
+                raise ParseError(instruction, "Invalid destination specified", line_num)
+
+        jump = "null"
+        if has_jump:
+            # jump is specified. make sure there is only 1 ;
+            if instruction.count(";") != 1:
+                raise ParseError(instruction, "Multiple jumps specified", line_num)
+            jump = instruction.split(";")[1]
+            if jump not in self._jumps:
+                raise ParseError(instruction, "Invalid jump specified", line_num)
+
+        return Instruction(self.C_COMMAND, dest=dest, comp=comp, jump=jump, line_num=line_num)
+
     # return true if there are more commands to process
     def has_more_commands(self):
-        if self._index < (self._numlines - 1):
+        if self._index < (len(self._input) - 1):
             return True
         else:
             return False
     
-    # advance the current command
+    # advance the current command, decoding it once
     def advance(self):
         if self.has_more_commands():
             self._index += 1
+            self._current = self.decode(self._input[self._index], self._index + 1)
     
     # return the current instruction
     def current_instruction(self):
-        if self._index >= 0 and self._index < self._numlines:
+        if self._index >= 0 and self._index < len(self._input):
             return self.remove_whitespace(self._input[self._index])
         else:
             raise ParseError(self._index, "Index out of range, no current instruction")
 
+    # return the decoded record of the current instruction, None for an empty line
+    def current_record(self):
+        self.current_instruction()
+        return self._current
+
     # return the command type of the existing instruction
     def command_type(self):
-        line = self.current_instruction()
-        if re.search("^@[0-9]+$", line) or re.search("^@[a-zA-Z][a-zA-Z0-9_\.\$\:]*$", line):
-            return self.A_COMMAND
-        elif re.search("^\([a-zA-Z_\.\$\:][a-zA-Z0-9_\.\$\:]*\)$", line):
-            return self.L_COMMAND
-        elif line == "":
+        record = self.current_record()
+        if record is None:
             return self.EMPTY_LINE
-        else:
-            return self.C_COMMAND
+        return record.kind
 
     def symbol(self):
-        if self.command_type() == self.A_COMMAND:
-            instruction = self.current_instruction()
-            stripped = instruction.replace('@', '')
-            try:
-                stripped_int = int(stripped)
-                if stripped_int < 32768 and stripped_int >= 0:
-                    return stripped
-                else:
-                    raise ParseError(instruction, "Invalid value in A-instruction: {}. Value must be between 0 and 32767 (inclusive)".format(stripped_int))
-            except ValueError:
-                return stripped
-        elif self.command_type() == self.L_COMMAND:
-            return self.current_instruction().replace('(', '').replace(')', '')
-        else:
-            raise ParseError(self.current_instruction(), "Cannot determine symbol for a c-instruction")
+        record = self.current_record()
+        if record is not None and record.kind != self.C_COMMAND:
+            return str(record.symbol)
+        raise ParseError(self.current_instruction(), "Cannot determine symbol for a c-instruction")
 
     def dest(self):
-        if self.command_type() == self.C_COMMAND:
-            if re.search('=', self.current_instruction()):
-                # destination is specified. make sure there is only one =
-                if self.current_instruction().count("=") == 1:
-                    split = self.current_instruction().split("=")
-                    if split[0] in self.DESTINATIONS:
-                        return split[0]
-                    else:
-                        raise ParseError(self.current_instruction(), "Invalid destination specified")
-                else:
-                    raise ParseError(self.current_instruction(), "Multiple destinations specified")
-            else:
-                # no destination is specified
-                return "null"
-        else:
-            raise ParseError(self.current_instruction(), "Can only determine dest for C-instructions")
+        record = self.current_record()
+        if record is not None and record.kind == self.C_COMMAND:
+            return record.dest
+        raise ParseError(self.current_instruction(), "Can only determine dest for C-instructions")
     
     def comp(self):
-        if self.command_type() == self.C_COMMAND:
-            line = self.current_instruction()
-            comp = ""
-            if re.search('=', line) and re.search(';', line):
-                # if = and ; are present, it is the part between the two
-                splitline = line.split('=')[1]
-                comp = splitline.split(';')[0]
-            elif re.search('=', line):
-                # if only = is present, it is the part to the right of =
-                comp = line.split('=')[1]
-            elif re.search(';', line):
-                # if only ; is present it is the part to the left of ;
-                comp = line.split(';')[0]
-            else:
-                # if neither = or ; are present, it is the entire string (really useless but whatever)
-                comp = line
-            if comp in self.COMPUTATIONS:
-                return comp
-            else:
-                raise ParseError(self.current_instruction(), "Invalid computation specified")
-
-        else:
-            raise ParseError(self.current_instruction(), "Can only determine comp for C-instructions")
+        record = self.current_record()
+        if record is not None and record.kind == self.C_COMMAND:
+            return record.comp
+        raise ParseError(self.current_instruction(), "Can only determine comp for C-instructions")
 
     def jump(self):
-        if self.command_type() == self.C_COMMAND:
-            if re.search(';', self.current_instruction()):
-                # jump is specified. make sure there is only 1 ;
-                if self.current_instruction().count(";") == 1:
-                    split = self.current_instruction().split(";")
-                    if split[1] in self.JUMPS:
-                        return split[1]
-                    else:
-                        raise ParseError(self.current_instruction(), "Invalid jump specified")
-                else:
-                    raise ParseError(self.current_instruction(), "Multiple jumps specified")
-            else:
-                # no destination is specified
-                return "null"
-        else:
-            raise ParseError(self.current_instruction(), "Can only determine dest for C-instructions")
\ No newline at end of file
+        record = self.current_record()
+        if record is not None and record.kind == self.C_COMMAND:
+            return record.jump
+        raise ParseError(self.current_instruction(), "Can only determine dest for C-instructions")
@@ -0,0 +1,100 @@
+from .instruction import Instruction
+from .parser import Parser
+
+class PeepholeOptimizer():
+    """Peephole optimizer over a stream of decoded instructions.
+
+    The optimizer tracks which symbol is known to be loaded in the A register
+    and removes instructions that cannot change the behavior of the program:
+
+    - redundant reloads: an A-instruction loading the symbol A already holds
+    - dead loads: an A-instruction immediately overwritten by another one
+    - adjacent increments and decrements of the same memory location, such
+      as @SP / M=M+1 / @SP / AM=M-1, which fold into @SP / A=M
+
+    Knowledge of A is dropped at every label, since a label can be reached
+    by a jump. Labels are never removed and label addresses are only
+    computed after optimizing, so every label still refers to the
+    instruction it preceded (or to the first instruction kept after it).
+
+    Removing instructions moves code, which breaks jumps to numeric
+    addresses. Programs with an A-constant directly followed by a jump
+    are therefore returned unchanged.
+
+    Attributes:
+        removed -- number of instructions removed by the last optimize()
+    """
+    INCREMENT = "M+1"
+    DECREMENT = "M-1"
+    INVERSE = {INCREMENT: DECREMENT, DECREMENT: INCREMENT}
+
+    def __init__(self):
+        self.removed = 0
+
+    # return true if instructions jump to a numeric address anywhere
+    def _has_numeric_jumps(self, instructions):
+        previous = None
+        for instruction in instructions:
+            if (instruction.kind == Parser.C_COMMAND and instruction.jump != "null"
+                    and previous is not None and previous.kind == Parser.A_COMMAND
+                    and isinstance(previous.symbol, int)):
+                return True
+            previous = instruction
+        return False
+
+    # return the destination left when the memory write is removed from dest
+    def _without_m(self, dest):
+        dest = dest.replace("M", "")
+        if dest == "":
+            return None
+        return dest
+
+    # optimize a list of instructions, returns the optimized list
+    def optimize(self, instructions):
+        self.removed = 0
+        if self._has_numeric_jumps(instructions):
+            return instructions
+
+        out = []
+        a_symbol = None                 # symbol known to be loaded in A, None if unknown
+        for instruction in instructions:
+            if instruction.kind == Parser.L_COMMAND:
+                out.append(instruction)
+                a_symbol = None
+                continue
+
+            if instruction.kind == Parser.A_COMMAND:
+                if a_symbol is not None and instruction.symbol == a_symbol:
+                    # A already holds this symbol
+                    continue
+                if out and out[-1].kind == Parser.A_COMMAND:
+                    # the previous load is overwritten before it is used
+                    out.pop()
+                out.append(instruction)
+                a_symbol = instruction.symbol
+                continue
+
+            previous = out[-1] if out else None
+            if (previous is not None and previous.kind == Parser.C_COMMAND
+                    and previous.dest == "M" and previous.jump == "null"
+                    and previous.comp in self.INVERSE
+                    and instruction.comp == self.INVERSE[previous.comp]
+                    and "M" in instruction.dest and instruction.jump == "null"):
+                # M=M+1 followed by M=M-1 (or the reverse) at the same address
+                # leaves memory unchanged. keep only the other destinations,
+                # which receive the original value of M
+                out.pop()
+                dest = self._without_m(instruction.dest)
+                if dest is not None:
+                    out.append(Instruction(Parser.C_COMMAND, dest=dest, comp="M", jump="null",
+                                           line_num=instruction.line_num))
+                    if "A" in dest:
+                        a_symbol = None
+                continue
+
+            out.append(instruction)
+            if "A" in instruction.dest:
+                a_symbol = None
+
+        self.removed = len(instructions) - len(out)
+        return out
@@ -0,0 +1,69 @@
+import re
+
+# number of words in the instruction memory
+ROM_SIZE = 32768
+
+class RomReport():
+    """Report of how much of the ROM each function of a program uses.
+
+    A function starts at a label named like a VM function (Class.function,
+    without $ or further dots) and runs up to the next one. A label named
+    after a function with a known prefix (INTERNAL_PREFIXES, e.g.
+    LOOP_screen.drawline, made up by some translators within
+    screen.drawline) is internal to that function and does not start one.
+    Only those exact prefixes count, so classes whose names share a suffix
+    (Game and PongGame) are still reported separately. Code before the
+    first function is reported as PREAMBLE. Programs without any such label
+    (e.g. hand-written assembly) are split at every label instead.
+
+    The functions are told apart by label names only. Other labels of the
+    Class.function shape that a translator makes up within a function are
+    reported as functions of their own, and the function they are in is
+    cut short.
+
+    Attributes:
+        INTERNAL_PREFIXES -- prefixes of labels made up within a function
+        _sizes -- list of (name, number of words), in rom order
+        _words -- total number of words of the program
+    """
+    FUNCTION_PATTERN = re.compile(r"[^\.\$]+\.[^\.\$]+$")
+    PREAMBLE = "(preamble)"
+    INTERNAL_PREFIXES = ("LOOP_",)
+
+    def __init__(self, labels, words):
+        self._words = words
+        ordered = sorted(labels.items(), key=lambda entry: entry[1])
+        candidates = set(label for label in labels if self.FUNCTION_PATTERN.match(label))
+        functions = [(label, address) for (label, address) in ordered
+                     if label in candidates and not self._is_internal(label, candidates)]
+        if not functions:
+            functions = ordered
+
+        self._sizes = []
+        start = 0
+        name = self.PREAMBLE
+        for (label, address) in functions:
+            if address > start or name != self.PREAMBLE:
+                self._sizes.append((name, address - start))
+            (name, start) = (label, address)
+        if words > start or name != self.PREAMBLE:
+            self._sizes.append((name, words - start))
+
+    # return true if label is another function label with an internal prefix
+    def _is_internal(self, label, functions):
+        return any(label.startswith(prefix) and label[len(prefix):] in functions
+                   for prefix in self.INTERNAL_PREFIXES)
+
+    # return a list of (name, number of words), in rom order
+    def sizes(self):
+        return list(self._sizes)
+
+    # return the report as printable lines, largest function first
+    def report(self):
+        lines = [
+            "ROM usage: {} of {} words ({:.2f}%)".format(self._words, ROM_SIZE, 100.0 * self._words / ROM_SIZE),
+            "{:<40} {:>8} {:>8} {:>8}".format("function", "words", "bytes", "% ROM"),
+        ]
+        for (name, words) in sorted(self._sizes, key=lambda entry: entry[1], reverse=True):
+            lines.append("{:<40} {:>8} {:>8} {:>7.2f}%".format(name, words, words * 2, 100.0 * words / ROM_SIZE))
+        return lines
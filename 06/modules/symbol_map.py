@@ -0,0 +1,57 @@
+import json
+from array import array
+
+from .parser import Parser
+from .symbol_table import SymbolTable
+
+class SymbolMap():
+    """Debug information of an assembled program, written as a JSON sidecar.
+
+    The sidecar holds every label with its rom address, every variable with
+    its ram address, and the source line of every rom address, so tools can
+    attribute cycles to code without parsing the .asm again:
+
+        {"source": "Prog.asm", "labels": {"LOOP": 4}, "variables": {"i": 16},
+         "lines": [3, 4, 6, ...]}
+
+    lines[n] is the line number (starting at 1) of the instruction at rom
+    address n.
+
+    Attributes:
+        source -- name of the source file
+        line_map -- source line number of every rom address (array of uint32)
+        labels -- dict of label -> rom address
+        variables -- dict of variable -> ram address
+    """
+    EXTENSION = ".sym.json"
+
+    def __init__(self, source):
+        self.source = source
+        self.line_map = array('I')
+        self.labels = {}
+        self.variables = {}
+
+    # pass instructions through, recording the line of every instruction that takes a rom word
+    def record_lines(self, instructions):
+        line_map = self.line_map
+        for instruction in instructions:
+            if instruction.kind != Parser.L_COMMAND:
+                line_map.append(instruction.line_num)
+            yield instruction
+
+    # take the labels and variables from the symbol table of the assembled program
+    def add_symbols(self, symbol_table):
+        self.labels = symbol_table.entries(SymbolTable.K_LABEL)
+        self.variables = symbol_table.entries(SymbolTable.K_VARIABLE)
+
+    def to_dict(self):
+        return {
+            "source": self.source,
+            "labels": self.labels,
+            "variables": self.variables,
+            "lines": self.line_map.tolist(),
+        }
+
+    # write the sidecar to an open text file
+    def write(self, fd):
+        json.dump(self.to_dict(), fd, separators=(",", ":"))
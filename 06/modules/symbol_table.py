@@ -1,12 +1,22 @@
 
 
+from types import MappingProxyType
+
 class SymbolTable():
     """Symbol table to keep track of dynamic symbols in asm files
 
+    Symbols added during an assembly are layered over the predefined symbols,
+    which are read-only and shared by every table. Many programs can therefore
+    be assembled in one process without symbols leaking between them.
+
     Attributes:
-        _table -- The symbol table (dictionary)
+        _table -- symbols added by this assembly (dictionary)
+        _variables -- the symbols of _table that are variables, the others are labels
     """
-    PREDEFINED_SYMBOLS = {
+    K_LABEL = "label"
+    K_VARIABLE = "variable"
+
+    PREDEFINED_SYMBOLS = MappingProxyType({
         "SP": 0,
         "LCL": 1,
         "ARG": 2,
@@ -30,19 +40,33 @@ class SymbolTable():
         "R15": 15,
         "SCREEN": 16384,
         "KBD": 24576,
-    }
+    })
 
     def __init__(self):
-        self._table = self.PREDEFINED_SYMBOLS
+        self._table = {}
+        self._variables = set()
     
-    def add_entry(self, symbol, address):
+    def add_entry(self, symbol, address, kind=K_LABEL):
         self._table[symbol] = address
+        if kind == self.K_VARIABLE:
+            self._variables.add(symbol)
     
     def contains(self, symbol):
-        if symbol in self._table.keys():
+        if symbol in self._table or symbol in self.PREDEFINED_SYMBOLS:
             return True
         else:
             return False
     
     def get_address(self, symbol):
-        return self._table[symbol]
\ No newline at end of file
+        address = self._table.get(symbol)
+        if address is None:
+            return self.PREDEFINED_SYMBOLS[symbol]
+        return address
+
+    # return the symbols added by this assembly, without the predefined symbols
+    # if kind is given, only the labels or only the variables
+    def entries(self, kind=None):
+        if kind is None:
+            return dict(self._table)
+        is_variable = kind == self.K_VARIABLE
+        return {symbol: address for (symbol, address) in self._table.items() if (symbol in self._variables) == is_variable}
\ No newline at end of file
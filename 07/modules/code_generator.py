@@ -26,7 +26,7 @@ class CodeGenerator():
     # generate preamble asm code
     # Init SP, LCL, ARG, THIS, and THAT
     def generate_preamble(self):
-        asm_cmds = [
+        yield from [
             "// preamble",
             "@256",             # SP=256
             "D=A",
@@ -54,7 +54,6 @@ class CodeGenerator():
             "M=D",
             "// end preamble"     
         ]
-        return asm_cmds
 
     # generates the arithmetic ASM commands
     # assumes stack is setup as follows:
@@ -66,7 +65,6 @@ class CodeGenerator():
         if command not in config.ARITHMETIC_COMMANDS:
             raise CodeError(command, "Is not a valid arithmetic command")
 
-        asm_cmds = []
         switch = {
             "add": self._a_add,
             "sub": self._a_sub,
@@ -79,155 +77,144 @@ class CodeGenerator():
             "not": self._a_not,
         }
         func = switch.get(command)
-        return func()
+        yield from func()
 
     # generates push and pop asm commands
     def generate_push_pop(self, command, segment, index):
         if command not in config.PUSH_POP_COMMANDS:
             raise CodeError(command, "Is not a valid push or pop command")
 
-        asm_cmds = []
-
         if command == config.C_PUSH:
             if segment not in config.SEGMENTS.keys():
                 raise CodeError(segment, "Cannot process segment for push command")
             
             # push the value of segment[index] to the stack
-            return self._asm_push_segment(segment, index)
+            yield from self._asm_push_segment(segment, index)
         if command == config.C_POP:
             if segment not in config.SEGMENTS.keys() or segment == config.S_CONSTANT:
                 raise CodeError(segment, "Cannot process segment for pop command")
-            return self._asm_pop_segment(segment, index)
+            yield from self._asm_pop_segment(segment, index)
     
     # generates asm for the add VM arithemteic command
     def _a_add(self):
-        asm_cmds = self._asm_pop_d()            # SP--;D=*M[SP]
-        asm_cmds.extend([
+        yield from self._asm_pop_d()            # SP--;D=*M[SP]
+        yield from [
             "@SP",                              # A=SP
             "M=M-1",                            # SP--
             "A=M",                              # A=M[SP]
             "D=D+M",                            # D=D+*M[SP]
-        ])
-        asm_cmds.extend(self._asm_push_d())
-        return asm_cmds
+        ]
+        yield from self._asm_push_d()
     
     # generates asm for the sub VM arithmetic command
     def _a_sub(self):
-        asm_cmds = self._asm_pop_d()            # SP--;D=*M[SP]
-        asm_cmds.extend([
+        yield from self._asm_pop_d()            # SP--;D=*M[SP]
+        yield from [
             "D=-D",                             # D=-D
             "@SP",                              # A=SP
             "M=M-1",                            # SP--
             "A=M",                              # A=M[SP]
             "D=D+M"                             # D=D+*M[SP]  (aka x + -y aka x - y)
-        ])
-        asm_cmds.extend(self._asm_push_d())
-        return asm_cmds
+        ]
+        yield from self._asm_push_d()
     
     # generates asm for the neg VM arithmetic command
     def _a_neg(self):
-        asm_cmds = self._asm_pop_d()            # SP--;D=*M[SP]
-        asm_cmds.extend([
+        yield from self._asm_pop_d()            # SP--;D=*M[SP]
+        yield from [
             "D=-D",                             # D=-D
-        ])
-        asm_cmds.extend(self._asm_push_d())
-        return asm_cmds
+        ]
+        yield from self._asm_push_d()
     
     # generates asm for the eq VM arithmetic command
     # if x - y == 0, they are equal.
     def _a_eq(self):
-        asm_cmds = self._a_sub()
-        asm_cmds.extend([
+        yield from self._a_sub()
+        yield from [
             "@A_EQ_TRUE{}".format(self._a_eq_ctr),
             "D;JEQ",
-        ])
-        asm_cmds.extend(self._asm_push_false())
-        asm_cmds.extend([
+        ]
+        yield from self._asm_push_false()
+        yield from [
             "@A_EQ_DONE{}".format(self._a_eq_ctr),
             "0;JMP",
             "(A_EQ_TRUE{})".format(self._a_eq_ctr),
-        ])
-        asm_cmds.extend(self._asm_push_true())
-        asm_cmds.extend([
+        ]
+        yield from self._asm_push_true()
+        yield from [
             "(A_EQ_DONE{})".format(self._a_eq_ctr),
-        ])
+        ]
         self._a_eq_ctr += 1
-        return asm_cmds
 
     # generates asm for the gt VM arithmetic command
     # if x - y > 0, true.
     def _a_gt(self):
-        asm_cmds = self._a_sub()
-        asm_cmds.extend([
+        yield from self._a_sub()
+        yield from [
             "@A_GT_TRUE{}".format(self._a_gt_ctr),
             "D;JGT",
-        ])
-        asm_cmds.extend(self._asm_push_false())
-        asm_cmds.extend([
+        ]
+        yield from self._asm_push_false()
+        yield from [
             "@A_GT_DONE{}".format(self._a_gt_ctr),
             "0;JMP",
             "(A_GT_TRUE{})".format(self._a_gt_ctr),
-        ])
-        asm_cmds.extend(self._asm_push_true())
-        asm_cmds.extend([
+        ]
+        yield from self._asm_push_true()
+        yield from [
             "(A_GT_DONE{})".format(self._a_gt_ctr),
-        ])
+        ]
         self._a_gt_ctr += 1
-        return asm_cmds
 
     # generates asm for the lt VM arithmetic command
     # if x - y < 0, true.
     def _a_lt(self):
-        asm_cmds = self._a_sub()
-        asm_cmds.extend([
+        yield from self._a_sub()
+        yield from [
             "@A_LT_TRUE{}".format(self._a_lt_ctr),
             "D;JLT",
-        ])
-        asm_cmds.extend(self._asm_push_false())
-        asm_cmds.extend([
+        ]
+        yield from self._asm_push_false()
+        yield from [
             "@A_LT_DONE{}".format(self._a_lt_ctr),
             "0;JMP",
             "(A_LT_TRUE{})".format(self._a_lt_ctr),
-        ])
-        asm_cmds.extend(self._asm_push_true())
-        asm_cmds.extend([
+        ]
+        yield from self._asm_push_true()
+        yield from [
             "(A_LT_DONE{})".format(self._a_lt_ctr),
-        ])
+        ]
         self._a_lt_ctr += 1
-        return asm_cmds
     
     # generates asm for the and VM arithmetic command
     def _a_and(self):
-        asm_cmds = self._asm_pop_d()
-        asm_cmds.extend([
+        yield from self._asm_pop_d()
+        yield from [
             "@SP",                      # A=SP
             "M=M-1",                    # SP--
             "A=M",                      # A=*M[SP]
             "D=D&M"                     # D=D&*M[SP]
-        ])
-        asm_cmds.extend(self._asm_push_d())
-        return asm_cmds
+        ]
+        yield from self._asm_push_d()
 
     # generates asm for the or VM arithmetic command
     def _a_or(self):
-        asm_cmds = self._asm_pop_d()
-        asm_cmds.extend([
+        yield from self._asm_pop_d()
+        yield from [
             "@SP",                      # A=SP
             "M=M-1",                    # SP--
             "A=M",                      # A=*M[SP]
             "D=D|M"                     # D=D|*M[SP]
-        ])
-        asm_cmds.extend(self._asm_push_d())
-        return asm_cmds
+        ]
+        yield from self._asm_push_d()
 
     # generates asm for the not VM arithmetic command
     def _a_not(self):
-        asm_cmds = self._asm_pop_d()
-        asm_cmds.extend([
+        yield from self._asm_pop_d()
+        yield from [
             "D=!D",     # D = -y
-        ])
-        asm_cmds.extend(self._asm_push_d())
-        return asm_cmds
+        ]
+        yield from self._asm_push_d()
 
     # helper method to push a constant (index) to the stack
     def _asm_push_constant(self, index):
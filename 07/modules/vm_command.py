@@ -0,0 +1,27 @@
+class VmCommand():
+    """Immutable record of a single parsed vm command.
+
+    Attributes:
+        command_type -- command type (config.C_PUSH, config.C_ARITHMETIC, ...)
+        arg1 -- first argument, the command itself for arithmetic commands,
+                None for commands without arguments
+        arg2 -- second argument (an integer), None for commands without one
+        line_num -- line number of the command in the vm file (starting at 1)
+    """
+    __slots__ = ("command_type", "arg1", "arg2", "line_num")
+
+    def __init__(self, command_type, arg1=None, arg2=None, line_num=None):
+        object.__setattr__(self, "command_type", command_type)
+        object.__setattr__(self, "arg1", arg1)
+        object.__setattr__(self, "arg2", arg2)
+        object.__setattr__(self, "line_num", line_num)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("VmCommand is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("VmCommand is immutable")
+
+    def __repr__(self):
+        return "VmCommand({}, arg1={!r}, arg2={!r}, line_num={})".format(
+            self.command_type, self.arg1, self.arg2, self.line_num)
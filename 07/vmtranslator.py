@@ -2,12 +2,51 @@ import argparse
 import re
 import os
 
+from modules.asm_writer import AsmWriter
 from modules.parser import Parser
 from modules.parse_error import ParseError
 from modules.code_error import CodeError
 from modules.code_generator import CodeGenerator
 from modules import config
 
+# stream the generated asm lines to an .asm file
+def write_asm(asm_lines, output):
+    tmpfile = "{}.tmp".format(output)
+    try:
+        with open(tmpfile, "w") as f:
+            AsmWriter(f).write_lines(asm_lines)
+    except:
+        if os.path.exists(tmpfile):
+            os.remove(tmpfile)
+        raise
+    os.replace(tmpfile, output)
+
+# generate the asm lines of a single vm file
+def translate_file(code_gen, file):
+    # open and load the file into a list
+    vm_input = []
+    with open(file) as f:
+        vm_input = f.readlines()
+    vmfile = file.strip(".vm")
+    vmfile = os.path.split(vmfile)[-1]
+
+    # each vm file gets its own parser
+    parser = Parser(vm_input)
+    # set vmfile name, used to generate static variable symbols
+    code_gen.vmfile = vmfile
+    for command in parser.commands():
+        if command.command_type in config.PUSH_POP_COMMANDS:
+            yield from code_gen.generate_push_pop(command.command_type, command.arg1, command.arg2)
+        if command.command_type == config.C_ARITHMETIC:
+            yield from code_gen.generate_arithmetic(command.arg1)
+
+# generate the asm lines of the whole program, the preamble first.
+# lines are generated as they are consumed, the program is never held in memory
+def translate(infiles, code_gen):
+    yield from code_gen.generate_preamble()
+    for file in infiles:
+        yield from translate_file(code_gen, file)
+
 def main(input):
     infiles = []
     # determine if the inputs is a directory or vmfile
@@ -37,45 +76,16 @@ def main(input):
         exit(1)
     
     # single code generator for all vm files, single ASM output
-    code_gen = CodeGenerator()
-    asm_output = code_gen.generate_preamble()
+    asm_lines = translate(infiles, CodeGenerator())
 
-    # loop through all .vm files
-    for file in infiles:
-        # open and load the file into a list
-        vm_input = []
-        with open(file) as f:
-            vm_input = f.readlines()
-        vmfile = file.strip(".vm")
-        vmfile = os.path.split(vmfile)[-1]
-
-        # each vm file gets its own parser
-        parser = Parser(vm_input)
-        while parser.has_more_commands():
-            # set vmfile name, used to generate static variable symbols
-            code_gen.vmfile = vmfile
-            parser.advance()
-            try:
-                if parser.command_type() is config.C_EMPTY_LINE:
-                    # skip whitespace/blank lines
-                    continue
-                if parser.command_type() in config.PUSH_POP_COMMANDS:
-                    asm_output.extend(code_gen.generate_push_pop(parser.command_type(), parser.arg1(), parser.arg2()))
-                if parser.command_type() == config.C_ARITHMETIC:
-                    asm_output.extend(code_gen.generate_arithmetic(parser.arg1()))
-                    
-            except ParseError as err:
-                print("Parser error. Expression: <{}>. Error detail: {}".format(err.expression, err.message))
-                exit(1)
-            except CodeError as err:
-                print("Code generator error. Expression: <{}>. Error detail: {}".format(err.expression, err.message))
-                exit(1)
-
-    # write out asm file
-    with open(output, "w") as f:
-        for line in asm_output:
-            f.write(line)
-            f.write("\n")
+    try:
+        write_asm(asm_lines, output)
+    except ParseError as err:
+        print("Parser error. Expression: <{}>. Error detail: {}".format(err.expression, err.message))
+        exit(1)
+    except CodeError as err:
+        print("Code generator error. Expression: <{}>. Error detail: {}".format(err.expression, err.message))
+        exit(1)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
@@ -0,0 +1,39 @@
+from itertools import islice
+
+class AsmWriter():
+    """Writer class streaming generated asm lines to a file in blocks.
+
+    Lines are pulled from an iterable BLOCK_LINES at a time and joined, so
+    a block takes a single write call and only one block is held in memory.
+
+    Attributes:
+        _fd -- text file object opened for writing
+    """
+    BLOCK_LINES = 4096
+
+    def __init__(self, fd):
+        self._fd = fd
+
+    # helper method to write a block of lines, each followed by a newline
+    def _write_block(self, block):
+        self._fd.write("\n".join(block))
+        self._fd.write("\n")
+
+    # split lines into lists of at most BLOCK_LINES lines
+    def _blocks(self, lines):
+        lines = iter(lines)
+        block = list(islice(lines, self.BLOCK_LINES))
+        while block:
+            yield block
+            block = list(islice(lines, self.BLOCK_LINES))
+
+    # write all lines
+    def write_lines(self, lines):
+        for block in self._blocks(lines):
+            self._write_block(block)
+
+    # write lines as they are passed on to another consumer
+    def tee(self, lines):
+        for block in self._blocks(lines):
+            self._write_block(block)
+            yield from block
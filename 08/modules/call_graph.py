@@ -0,0 +1,66 @@
+from . import config
+
+class CallGraph():
+    """Calls between the functions of a whole vm program.
+
+    Built from the call commands of every vm file, it tells which functions
+    can be reached from the entry point of the program. vm code has no
+    indirect calls, so a function that is not reachable is never run and
+    does not need to be translated.
+
+    Code before the first function of a file runs outside of any function,
+    its calls are entry points as well.
+
+    Attributes:
+        calls -- dict of function -> set of functions it calls
+        files -- dict of vm file -> list of functions it defines
+        top_level -- set of vm files with code outside of any function
+        roots -- set of functions called from code outside of any function
+    """
+    # function called by the bootstrap code
+    ENTRY = "Sys.init"
+
+    def __init__(self):
+        self.calls = {}
+        self.files = {}
+        self.top_level = set()
+        self.roots = set()
+
+    # add the functions of a vm file, read through parser
+    def add_file(self, file, parser):
+        functions = self.files.setdefault(file, [])
+        called = None
+        for command in parser.commands():
+            if command.command_type == config.C_FUNCTION:
+                functions.append(command.arg1)
+                called = self.calls.setdefault(command.arg1, set())
+            elif called is None:
+                self.top_level.add(file)
+                if command.command_type == config.C_CALL:
+                    self.roots.add(command.arg1)
+            elif command.command_type == config.C_CALL:
+                called.add(command.arg1)
+
+    # return true if the program defines function
+    def defines(self, function):
+        return function in self.calls
+
+    # return the set of functions reachable from the entry point, and from
+    # code outside of any function
+    def reachable(self):
+        reached = set()
+        pending = [self.ENTRY]
+        pending.extend(self.roots)
+        while pending:
+            function = pending.pop()
+            if function in reached or function not in self.calls:
+                continue
+            reached.add(function)
+            pending.extend(self.calls[function])
+        return reached
+
+    # return true if any code of file is reachable
+    def needs_file(self, file, reached):
+        if file in self.top_level:
+            return True
+        return any(function in reached for function in self.files.get(file, ()))
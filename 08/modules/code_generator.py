@@ -4,9 +4,60 @@ from . import config
 class CodeGenerator():
     """Generator class class responsible for generating ASM code from VM code.
 
+    Every vm file gets its own code generator. The labels a generator makes
+    up (comparisons and return addresses) are prefixed with its vm file, so
+    the output of a file does not depend on the files translated before it.
+
+    In shared mode, call, return, eq, gt and lt jump to routines emitted once
+    after the bootstrap code (generate_routines) instead of inlining their
+    code at every use. A call site sets R13 (function), R14 (number of
+    arguments) and R15 (return address) and jumps to the call routine, a
+    comparison sets R15 and jumps to the routine of its operator.
+
+    In stack cache mode, the value on top of the stack is kept in the D
+    register between vm commands instead of being written to the stack. A
+    push then only loads D, and the next command takes its operand from D
+    without touching memory. The cached value is written to the stack
+    (flushed) before anything that expects the whole stack in memory or
+    can be reached from another place: labels, goto, function, call and
+    return. if-goto consumes its condition from D.
+
     Attributes:
     """
-    def __init__(self, vmfile=None):
+    # label prefix of the code generator of the bootstrap code, which has no vm file
+    BOOTSTRAP_NAMESPACE = "bootstrap"
+
+    # labels of the shared routines, function names always contain a dot so they cannot clash
+    CALL_ROUTINE = "VM$call"
+    RETURN_ROUTINE = "VM$return"
+    COMPARE_ROUTINES = {
+        "eq": ("VM$eq", "JEQ"),
+        "gt": ("VM$gt", "JGT"),
+        "lt": ("VM$lt", "JLT"),
+    }
+
+    # jumps of the comparisons of the if compare superinstruction
+    COMPARE_JUMPS = {
+        "eq": "JEQ",
+        "ne": "JNE",
+        "gt": "JGT",
+        "le": "JLE",
+        "lt": "JLT",
+        "ge": "JGE",
+    }
+
+    # constants the alu computes without loading them
+    ALU_CONSTANTS = {
+        0: "0",
+        1: "1",
+        -1: "-1",
+    }
+
+    # largest index reached by incrementing a base pointer, beyond it adding
+    # the index is always shorter
+    MAX_INCREMENTS = 8
+
+    def __init__(self, vmfile=None, shared=False, stack_cache=False):
         # counters for labels generated during comparisons
         self._a_eq_ctr = 1
         self._a_gt_ctr = 1
@@ -14,6 +65,10 @@ class CodeGenerator():
         self._vmfile = vmfile
         self._current_function = None
         self._function_id = 1
+        self._shared = shared
+        self._stack_cache = stack_cache
+        # true while the top of the stack is in D and not in memory
+        self._d_cached = False
     
     # return value of the vmfile property
     @property
@@ -25,17 +80,33 @@ class CodeGenerator():
     def vmfile(self, newfile):
         self._vmfile = newfile
 
+    # return the prefix of the labels made up by this code generator
+    def _namespace(self):
+        if self._vmfile is None:
+            return self.BOOTSTRAP_NAMESPACE
+        return self._vmfile
+
     # generate preamble asm code
     # Init SP, LCL, ARG, THIS, and THAT
     def generate_init(self):
-        asm_cmds = [
+        yield from [
             "@256",             # SP=256
             "D=A",
             "@SP",
             "M=D",
         ]
-        asm_cmds.extend(self.generate_call("Sys.init", 0))
-        return asm_cmds
+        yield from self.generate_call("Sys.init", 0)
+        if self._shared:
+            yield from self.generate_routines()
+
+    # generate the routines shared by all call sites in shared mode
+    def generate_routines(self):
+        yield from self._call_routine()
+        yield "({})".format(self.RETURN_ROUTINE)
+        yield from self._asm_return()
+        for command in config.ARITHMETIC_COMMANDS:
+            if command in self.COMPARE_ROUTINES:
+                yield from self._compare_routine(*self.COMPARE_ROUTINES[command])
 
     # generates the arithmetic ASM commands
     # assumes stack is setup as follows:
@@ -47,7 +118,6 @@ class CodeGenerator():
         if command not in config.ARITHMETIC_COMMANDS:
             raise CodeError(command, "Is not a valid arithmetic command")
 
-        asm_cmds = []
         switch = {
             "add": self._a_add,
             "sub": self._a_sub,
@@ -60,83 +130,109 @@ class CodeGenerator():
             "not": self._a_not,
         }
         func = switch.get(command)
-        return func()
+        yield from func()
 
     # generates push and pop asm commands
     def generate_push_pop(self, command, segment, index):
         if command not in config.PUSH_POP_COMMANDS:
             raise CodeError(command, "Is not a valid push or pop command")
 
-        asm_cmds = []
-
         if command == config.C_PUSH:
             if segment not in config.SEGMENTS.keys():
                 raise CodeError(segment, "Cannot process segment for push command")
             
             # push the value of segment[index] to the stack
-            return self._asm_push_segment(segment, index)
+            yield from self._flush()
+            if self._stack_cache:
+                yield from self._asm_load_segment(segment, index)
+                yield from self._push_from_d()
+            else:
+                yield from self._asm_push_segment(segment, index)
         if command == config.C_POP:
             if segment not in config.SEGMENTS.keys() or segment == config.S_CONSTANT:
                 raise CodeError(segment, "Cannot process segment for pop command")
-            return self._asm_pop_segment(segment, index)
+            if self._stack_cache:
+                yield from self._pop_to_d()
+                yield from self._asm_store_d(segment, index)
+                return
+            yield from self._asm_pop_segment(segment, index)
     
     # generates asm for label
     def generate_label(self, label):
         if len(self._current_function) is None:
             raise CodeError(label, "Labels must be defined within a function")
-        asm_cmds = ["({}${})".format(self._current_function, label)]
-        return asm_cmds
+        yield from self._flush()
+        yield "({}${})".format(self._current_function, label)
     
     # generates asm for goto
     def generate_goto(self, label):
-        asm_cmds = [
+        yield from self._flush()
+        yield from [
             "@{}${}".format(self._current_function, label),
             "0;JMP",
         ]
-        return asm_cmds
 
     # generate asm for if-goto
     # pop the topmost value from the stack
     # if the value != 0, then jump to label
     # else, continue as normal
     def generate_if(self, label):
-        asm_cmds = self._asm_pop_d()
-        asm_cmds.extend([
+        yield from self._pop_to_d()
+        yield from [
             "@{}${}".format(self._current_function, label),
             "D;JNE"
-        ])
-        return asm_cmds
+        ]
 
     # generate asm for function definition
     def generate_function(self, name, num_locals):
         # store function name so we can appropriately name function labels
         self._current_function = name
-        asm_cmds = [
+        yield from self._flush()
+        yield from [
             "({})".format(name)
         ]
         # initialize the local vars (on stack) to zero
         for i in range(num_locals):
-            asm_cmds.extend(self._asm_push_constant(0))
-        return asm_cmds
+            yield from self._asm_push_segment(config.S_CONSTANT, 0)
     
     # generates asm for the call command
     def generate_call(self, name, num_args):
-        return_label = "{}.{}.return".format(name, self._function_id)
+        return_label = "{}.{}.{}.return".format(self._namespace(), name, self._function_id)
         self._function_id += 1
+        yield from self._flush()
+
+        if self._shared:
+            yield from [
+                "@{}".format(name),             # R13=function
+                "D=A",
+                "@R13",
+                "M=D",
+                "@{}".format(num_args),         # R14=num_args
+                "D=A",
+                "@R14",
+                "M=D",
+                "@{}".format(return_label),     # R15=return address
+                "D=A",
+                "@R15",
+                "M=D",
+                "@{}".format(self.CALL_ROUTINE),
+                "0;JMP",
+                "({})".format(return_label),
+            ]
+            return
 
-        asm_cmds = []
         # push return address onto the stack
-        asm_cmds.extend(self._asm_push_a(return_label))
+        yield from self._asm_push_a(return_label)
         # push LCL
-        asm_cmds.extend(self._asm_push_m("LCL"))
+        yield from self._asm_push_m("LCL")
         # push ARG
-        asm_cmds.extend(self._asm_push_m("ARG"))
+        yield from self._asm_push_m("ARG")
         # push THIS
-        asm_cmds.extend(self._asm_push_m("THIS"))
+        yield from self._asm_push_m("THIS")
         # push THAT
-        asm_cmds.extend(self._asm_push_m("THAT"))
+        yield from self._asm_push_m("THAT")
         # ARG = SP-num_args-5
-        asm_cmds.extend([
+        yield from [
             "@SP",
             "D=M",
             "@{}".format(num_args),
@@ -145,64 +241,148 @@ class CodeGenerator():
             "D=D-A",
             "@ARG",
             "M=D",
-        ])
+        ]
 
         # LCL = SP
-        asm_cmds.extend([
+        yield from [
             "@SP",
             "D=M",
             "@LCL",
             "M=D",
-        ])
+        ]
 
         # goto function
-        asm_cmds.extend([
+        yield from [
             "@{}".format(name),
             "0;JMP",
-        ])
+        ]
 
         # (return_label)
-        asm_cmds.append("({})".format(return_label))
-        
-        return asm_cmds
+        yield "({})".format(return_label)
     
     # generates asm for return
     def generate_return(self):
-        asm_cmds = []
+        yield from self._flush()
+        if self._shared:
+            yield from [
+                "@{}".format(self.RETURN_ROUTINE),
+                "0;JMP",
+            ]
+            return
+        yield from self._asm_return()
+
+    # helper method for the body of the call routine of shared mode
+    # R13 holds the address of the function, R14 the number of arguments
+    # and R15 the return address
+    def _call_routine(self):
+        yield "({})".format(self.CALL_ROUTINE)
+        # push return address, LCL, ARG, THIS and THAT
+        yield from self._asm_push_m("R15")
+        yield from self._asm_push_m("LCL")
+        yield from self._asm_push_m("ARG")
+        yield from self._asm_push_m("THIS")
+        yield from self._asm_push_m("THAT")
+        # ARG = SP-num_args-5
+        yield from [
+            "@R14",
+            "D=M",
+            "@5",
+            "D=D+A",
+            "@SP",
+            "D=M-D",
+            "@ARG",
+            "M=D",
+        ]
+        # LCL = SP
+        yield from [
+            "@SP",
+            "D=M",
+            "@LCL",
+            "M=D",
+        ]
+        # goto function
+        yield from [
+            "@R13",
+            "A=M",
+            "0;JMP",
+        ]
+
+    # helper method for the body of a comparison routine of shared mode
+    # replaces x and y on the stack with x jump y, then returns to R15
+    def _compare_routine(self, routine, jump):
+        yield from [
+            "({})".format(routine),
+            "@SP",
+            "AM=M-1",                   # SP--
+            "D=M",                      # D=y
+            "A=A-1",
+            "D=M-D",                    # D=x-y
+            "M=-1",                     # assume true
+            "@{}.done".format(routine),
+            "D;{}".format(jump),
+            "@SP",
+            "A=M-1",
+            "M=0",                      # false
+            "({}.done)".format(routine),
+            "@R15",
+            "A=M",
+            "0;JMP",
+        ]
+
+    # helper method to make up a label of the n-th comparison command of
+    # this generator, e.g. Main$eq.1.true. $ cannot occur in a function
+    # name, so the label never clashes with a function of the program
+    def _compare_label(self, command, n, part):
+        return "{}${}.{}.{}".format(self._namespace(), command, n, part)
+
+    # helper method to jump to the comparison routine of command in shared mode
+    def _a_compare_shared(self, command, return_label):
+        yield from [
+            "@{}".format(return_label),     # R15=return address
+            "D=A",
+            "@R15",
+            "M=D",
+            "@{}".format(self.COMPARE_ROUTINES[command][0]),
+            "0;JMP",
+            "({})".format(return_label),
+        ]
+
+    # helper method for the code of return, inline or as the return routine
+    def _asm_return(self):
         # FRAME = LCL (R13 will be FRAME)
-        asm_cmds.extend([
+        yield from [
             "@LCL",
             "D=M",
             "@R13",
             "M=D",
-        ])
+        ]
         # RET = *(FRAME - 5) (R14 will be RET)
-        asm_cmds.extend([
+        yield from [
             "@5",
             "D=D-A",
             "A=D",
             "D=M",
             "@R14",
             "M=D",
-        ])
+        ]
         # *ARG = pop() - pop from working stack and store the value at 
         # the memory location pointed to by ARG
-        asm_cmds.extend(self._asm_pop_d())
-        asm_cmds.extend([
+        yield from self._asm_pop_d()
+        yield from [
             "@ARG",
             "A=M",
             "M=D",
-        ])
+        ]
         # SP = ARG + 1
-        asm_cmds.extend([
+        yield from [
             "@ARG",
             "D=M",
             "D=D+1",
             "@SP",
             "M=D",
-        ])
+        ]
         # THAT = *(FRAME-1)
-        asm_cmds.extend([
+        yield from [
             "@R13",
             "D=M",
             "@1",
@@ -211,9 +391,9 @@ class CodeGenerator():
             "D=M",
             "@THAT",
             "M=D",
-        ])
+        ]
         # THIS = *(FRAME-2)
-        asm_cmds.extend([
+        yield from [
             "@R13",
             "D=M",
             "@2",
@@ -222,9 +402,9 @@ class CodeGenerator():
             "D=M",
             "@THIS",
             "M=D",
-        ])
+        ]
         # ARG = *(FRAME-3)
-        asm_cmds.extend([
+        yield from [
             "@R13",
             "D=M",
             "@3",
@@ -233,9 +413,9 @@ class CodeGenerator():
             "D=M",
             "@ARG",
             "M=D",
-        ])
+        ]
         # LCL = *(FRAME-4)
-        asm_cmds.extend([
+        yield from [
             "@R13",
             "D=M",
             "@4",
@@ -244,307 +424,335 @@ class CodeGenerator():
             "D=M",
             "@LCL",
             "M=D",
-        ])
+        ]
         # goto RET
-        asm_cmds.extend([
+        yield from [
             "@R14",
             "A=M",
             "0;JMP"
-        ])
-        return asm_cmds
+        ]
+
+    # generates asm for the move superinstruction of the vm optimizer:
+    # push source, pop destination without going through the stack
+    def generate_move(self, source, destination):
+        (source_segment, source_index) = source
+        (segment, index) = destination
+        if source_segment not in config.SEGMENTS.keys():
+            raise CodeError(source_segment, "Cannot process segment for push command")
+        if segment not in config.SEGMENTS.keys() or segment == config.S_CONSTANT:
+            raise CodeError(segment, "Cannot process segment for pop command")
+        yield from self._flush()
+        yield from self._asm_load_segment(source_segment, source_index)
+        yield from self._asm_store_d(segment, index)
+
+    # generates asm for the add constant superinstruction of the vm optimizer:
+    # push constant value, add (value can be negative for sub)
+    def generate_add_constant(self, value):
+        if self._stack_cache:
+            yield from self._pop_to_d()
+            if abs(value) == 1:
+                yield "D=D+1" if value > 0 else "D=D-1"
+            else:
+                yield from [
+                    "@{}".format(abs(value)),
+                    "D=D+A" if value > 0 else "D=D-A",
+                ]
+            yield from self._push_from_d()
+            return
+        # add to the top of the stack in place
+        if abs(value) == 1:
+            yield from [
+                "@SP",
+                "A=M-1",
+                "M=M+1" if value > 0 else "M=M-1",
+            ]
+            return
+        yield from [
+            "@{}".format(abs(value)),
+            "D=A",
+            "@SP",
+            "A=M-1",
+            "M=D+M" if value > 0 else "M=M-D",
+        ]
+
+    # generates asm for the if compare superinstruction of the vm optimizer:
+    # pop y, pop x and jump to label if x comparison y holds
+    def generate_if_compare(self, comparison, label):
+        if comparison not in self.COMPARE_JUMPS:
+            raise CodeError(comparison, "Is not a valid comparison")
+        yield from self._pop_to_d()             # D=y
+        yield from [
+            "@SP",
+            "AM=M-1",                           # SP--
+            "D=M-D",                            # D=x-y
+            "@{}${}".format(self._current_function, label),
+            "D;{}".format(self.COMPARE_JUMPS[comparison]),
+        ]
+
+    # generates asm for the if not superinstruction of the vm optimizer:
+    # pop a value and jump to label if not value is true (not 0)
+    def generate_if_not(self, label):
+        yield from self._pop_to_d()
+        yield from [
+            "D=!D",
+            "@{}${}".format(self._current_function, label),
+            "D;JNE",
+        ]
+
+    # generates asm for the end of a vm file, the next file must find the whole stack in memory
+    def generate_end(self):
+        yield from self._flush()
 
     # generates asm for the add VM arithemteic command
     def _a_add(self):
-        asm_cmds = self._asm_pop_d()            # SP--;D=*M[SP]
-        asm_cmds.extend([
+        yield from self._pop_to_d()            # SP--;D=*M[SP]
+        yield from [
             "@SP",                              # A=SP
             "M=M-1",                            # SP--
             "A=M",                              # A=M[SP]
             "D=D+M",                            # D=D+*M[SP]
-        ])
-        asm_cmds.extend(self._asm_push_d())
-        return asm_cmds
+        ]
+        yield from self._push_from_d()
     
     # generates asm for the sub VM arithmetic command
     def _a_sub(self):
-        asm_cmds = self._asm_pop_d()            # SP--;D=*M[SP]
-        asm_cmds.extend([
+        yield from self._pop_to_d()            # SP--;D=*M[SP]
+        yield from [
             "D=-D",                             # D=-D
             "@SP",                              # A=SP
             "M=M-1",                            # SP--
             "A=M",                              # A=M[SP]
             "D=D+M"                             # D=D+*M[SP]  (aka x + -y aka x - y)
-        ])
-        asm_cmds.extend(self._asm_push_d())
-        return asm_cmds
+        ]
+        yield from self._push_from_d()
     
     # generates asm for the neg VM arithmetic command
     def _a_neg(self):
-        asm_cmds = self._asm_pop_d()            # SP--;D=*M[SP]
-        asm_cmds.extend([
+        yield from self._pop_to_d()            # SP--;D=*M[SP]
+        yield from [
             "D=-D",                             # D=-D
-        ])
-        asm_cmds.extend(self._asm_push_d())
-        return asm_cmds
+        ]
+        yield from self._push_from_d()
     
     # generates asm for the eq VM arithmetic command
     # if x - y == 0, they are equal.
     def _a_eq(self):
-        asm_cmds = self._a_sub()
-        asm_cmds.extend([
-            "@A_EQ_TRUE{}".format(self._a_eq_ctr),
+        if self._shared:
+            yield from self._flush()
+            yield from self._a_compare_shared("eq", self._compare_label("eq", self._a_eq_ctr, "done"))
+            self._a_eq_ctr += 1
+            return
+        yield from self._a_sub()
+        if self._d_cached:
+            yield from self._asm_compare_d(jump="JEQ", true_label=self._compare_label("eq", self._a_eq_ctr, "true"),
+                                           done_label=self._compare_label("eq", self._a_eq_ctr, "done"))
+            self._a_eq_ctr += 1
+            return
+        yield from [
+            "@{}".format(self._compare_label("eq", self._a_eq_ctr, "true")),
             "D;JEQ",
-        ])
-        asm_cmds.extend(self._asm_push_false())
-        asm_cmds.extend([
-            "@A_EQ_DONE{}".format(self._a_eq_ctr),
+        ]
+        yield from self._asm_push_false()
+        yield from [
+            "@{}".format(self._compare_label("eq", self._a_eq_ctr, "done")),
             "0;JMP",
-            "(A_EQ_TRUE{})".format(self._a_eq_ctr),
-        ])
-        asm_cmds.extend(self._asm_push_true())
-        asm_cmds.extend([
-            "(A_EQ_DONE{})".format(self._a_eq_ctr),
-        ])
+            "({})".format(self._compare_label("eq", self._a_eq_ctr, "true")),
+        ]
+        yield from self._asm_push_true()
+        yield from [
+            "({})".format(self._compare_label("eq", self._a_eq_ctr, "done")),
+        ]
         self._a_eq_ctr += 1
-        return asm_cmds
 
     # generates asm for the gt VM arithmetic command
     # if x - y > 0, true.
     def _a_gt(self):
-        asm_cmds = self._a_sub()
-        asm_cmds.extend([
-            "@A_GT_TRUE{}".format(self._a_gt_ctr),
+        if self._shared:
+            yield from self._flush()
+            yield from self._a_compare_shared("gt", self._compare_label("gt", self._a_gt_ctr, "done"))
+            self._a_gt_ctr += 1
+            return
+        yield from self._a_sub()
+        if self._d_cached:
+            yield from self._asm_compare_d(jump="JGT", true_label=self._compare_label("gt", self._a_gt_ctr, "true"),
+                                           done_label=self._compare_label("gt", self._a_gt_ctr, "done"))
+            self._a_gt_ctr += 1
+            return
+        yield from [
+            "@{}".format(self._compare_label("gt", self._a_gt_ctr, "true")),
             "D;JGT",
-        ])
-        asm_cmds.extend(self._asm_push_false())
-        asm_cmds.extend([
-            "@A_GT_DONE{}".format(self._a_gt_ctr),
+        ]
+        yield from self._asm_push_false()
+        yield from [
+            "@{}".format(self._compare_label("gt", self._a_gt_ctr, "done")),
             "0;JMP",
-            "(A_GT_TRUE{})".format(self._a_gt_ctr),
-        ])
-        asm_cmds.extend(self._asm_push_true())
-        asm_cmds.extend([
-            "(A_GT_DONE{})".format(self._a_gt_ctr),
-        ])
+            "({})".format(self._compare_label("gt", self._a_gt_ctr, "true")),
+        ]
+        yield from self._asm_push_true()
+        yield from [
+            "({})".format(self._compare_label("gt", self._a_gt_ctr, "done")),
+        ]
         self._a_gt_ctr += 1
-        return asm_cmds
 
     # generates asm for the lt VM arithmetic command
     # if x - y < 0, true.
     def _a_lt(self):
-        asm_cmds = self._a_sub()
-        asm_cmds.extend([
-            "@A_LT_TRUE{}".format(self._a_lt_ctr),
+        if self._shared:
+            yield from self._flush()
+            yield from self._a_compare_shared("lt", self._compare_label("lt", self._a_lt_ctr, "done"))
+            self._a_lt_ctr += 1
+            return
+        yield from self._a_sub()
+        if self._d_cached:
+            yield from self._asm_compare_d(jump="JLT", true_label=self._compare_label("lt", self._a_lt_ctr, "true"),
+                                           done_label=self._compare_label("lt", self._a_lt_ctr, "done"))
+            self._a_lt_ctr += 1
+            return
+        yield from [
+            "@{}".format(self._compare_label("lt", self._a_lt_ctr, "true")),
             "D;JLT",
-        ])
-        asm_cmds.extend(self._asm_push_false())
-        asm_cmds.extend([
-            "@A_LT_DONE{}".format(self._a_lt_ctr),
+        ]
+        yield from self._asm_push_false()
+        yield from [
+            "@{}".format(self._compare_label("lt", self._a_lt_ctr, "done")),
             "0;JMP",
-            "(A_LT_TRUE{})".format(self._a_lt_ctr),
-        ])
-        asm_cmds.extend(self._asm_push_true())
-        asm_cmds.extend([
-            "(A_LT_DONE{})".format(self._a_lt_ctr),
-        ])
+            "({})".format(self._compare_label("lt", self._a_lt_ctr, "true")),
+        ]
+        yield from self._asm_push_true()
+        yield from [
+            "({})".format(self._compare_label("lt", self._a_lt_ctr, "done")),
+        ]
         self._a_lt_ctr += 1
-        return asm_cmds
     
     # generates asm for the and VM arithmetic command
     def _a_and(self):
-        asm_cmds = self._asm_pop_d()
-        asm_cmds.extend([
+        yield from self._pop_to_d()
+        yield from [
             "@SP",                      # A=SP
             "M=M-1",                    # SP--
             "A=M",                      # A=*M[SP]
             "D=D&M"                     # D=D&*M[SP]
-        ])
-        asm_cmds.extend(self._asm_push_d())
-        return asm_cmds
+        ]
+        yield from self._push_from_d()
 
     # generates asm for the or VM arithmetic command
     def _a_or(self):
-        asm_cmds = self._asm_pop_d()
-        asm_cmds.extend([
+        yield from self._pop_to_d()
+        yield from [
             "@SP",                      # A=SP
             "M=M-1",                    # SP--
             "A=M",                      # A=*M[SP]
             "D=D|M"                     # D=D|*M[SP]
-        ])
-        asm_cmds.extend(self._asm_push_d())
-        return asm_cmds
+        ]
+        yield from self._push_from_d()
 
     # generates asm for the not VM arithmetic command
     def _a_not(self):
-        asm_cmds = self._asm_pop_d()
-        asm_cmds.extend([
+        yield from self._pop_to_d()
+        yield from [
             "D=!D",     # D = -y
-        ])
-        asm_cmds.extend(self._asm_push_d())
-        return asm_cmds
-
-    # helper method to push a constant (index) to the stack
-    def _asm_push_constant(self, index):
-        asm_cmds = [
-            "@{}".format(index),
-            "D=A",
-        ]
-        asm_cmds.extend(self._asm_push_d())
-        return asm_cmds
-    
-    # helper method to push from the temp segment
-    # index must be between 0 and 7 inclusive
-    def _asm_push_temp(self, index):
-        if index < 0 or index > 7:
-            raise CodeError(index, "index must be between 0 and 7 (inclusive)")
-
-        asm_cmds = [
-            "@{}".format(config.S_TEMP_BASE),# A=5
-            "D=A",                           # D=5
-            "@{}".format(index),             # A=index
-            "D=D+A",                         # D=5+index
-            "A=D",                           # A=5+index
-            "D=M",                           # D=M[5+index]
         ]
-        asm_cmds.extend(self._asm_push_d())
-        return asm_cmds
-
-    # helper method to pop into the temp segment
-    # index must be between 0 and 7 inclusive
-    def _asm_pop_temp(self, index):
-        if index < 0 or index > 7:
+        yield from self._push_from_d()
+
+    # template selection: push, pop, load and store on segment[index] are
+    # built from every sequence that is correct for (segment, index), and
+    # the shortest one is emitted. e.g. local 0 and 1 are reached from the
+    # base pointer without adding the index, temp, pointer and static are
+    # addressed directly and push constant 0, 1 and -1 store the value
+    # without loading it
+    def _shortest(self, *candidates):
+        return min((asm_cmds for asm_cmds in candidates if asm_cmds is not None), key=len)
+
+    # helper method to check the index of the temp and pointer segments
+    def _check_index(self, segment, index):
+        if segment == config.S_TEMP and (index < 0 or index > 7):
             raise CodeError(index, "index must be between 0 and 7 (inclusive)")
-
-        asm_cmds = [
-            "@{}".format(config.S_TEMP_BASE),
-            "D=A",
-            "@{}".format(index),
-            "D=D+A",
-            "@R13",
-            "M=D",
-        ]
-        asm_cmds.extend(self._asm_pop_d())
-        asm_cmds.extend([
-            "@R13",
-            "A=M",
-            "M=D",
-        ])
-        return asm_cmds
-    
-    # helper method to push from the pointer segment
-    # index must be between 0 and 1 inclusive
-    def _asm_push_pointer(self, index):
-        if index < 0 or index > 1:
-            raise CodeError(index, "index must be between 0 and 1 (inclusive)")
-        
-        asm_cmds = [
-            "@{}".format(config.S_POINTER_BASE),# A=3
-            "D=A",                              # D=3
-            "@{}".format(index),                # A=index
-            "D=D+A",                            # D=3+index
-            "A=D",                              # A=3+index
-            "D=M",                              # D=M[3+index]
-        ]
-        asm_cmds.extend(self._asm_push_d())
-        return asm_cmds
-    
-    # helper method to pop into the pointer segment
-    def _asm_pop_pointer(self, index):
-        if index < 0 or index > 1:
+        if segment == config.S_POINTER and (index < 0 or index > 1):
             raise CodeError(index, "index must be between 0 and 1 (inclusive)")
 
-        asm_cmds = [
-            "@{}".format(config.S_POINTER_BASE),
-            "D=A",
-            "@{}".format(index),
-            "D=D+A",
-            "@R13",
-            "M=D",
-        ]
-        asm_cmds.extend(self._asm_pop_d())
-        asm_cmds.extend([
-            "@R13",
-            "A=M",
-            "M=D",
-        ])
-        return asm_cmds
-    
-    def _asm_push_static(self, index):
-        if self.vmfile == None:
-            raise CodeError("vmfile", "vmfile must be defined for push static")
-        asm_cmds = [
-            "@{}.{}".format(self.vmfile, index),
-            "D=M",
-        ]
-        asm_cmds.extend(self._asm_push_d())
-        return asm_cmds
-    
-    def _asm_pop_static(self, index):
-        if self.vmfile == None:
-            raise CodeError("vmfile", "vmfile must be defined for pop static")
-
-        asm_cmds = [
-            "@{}.{}".format(self.vmfile, index),
-            "D=A",
-            "@R13",
-            "M=D",
-        ]
-        asm_cmds.extend(self._asm_pop_d())
-        asm_cmds.extend([
-            "@R13",
-            "A=M",
-            "M=D",
-        ])
+    # helper method to return the fixed address of segment[index] as an A
+    # instruction, None for segments addressed through a base pointer
+    def _asm_fixed_address(self, segment, index):
+        self._check_index(segment, index)
+        if segment == config.S_TEMP:
+            return "@{}".format(config.S_TEMP_BASE + index)
+        if segment == config.S_POINTER:
+            return "@{}".format(config.S_POINTER_BASE + index)
+        if segment == config.S_STATIC:
+            if self.vmfile == None:
+                raise CodeError("vmfile", "vmfile must be defined for static")
+            return "@{}.{}".format(self.vmfile, index)
+        return None
+
+    # helper method to point A at segment[index] by incrementing its base
+    # pointer, D is left alone. None if it would take more than MAX_INCREMENTS
+    def _asm_increment_address(self, segment, index):
+        if index < 0 or index > self.MAX_INCREMENTS:
+            return None
+        asm_cmds = ["@{}".format(config.SEGMENTS[segment])]
+        if index == 0:
+            asm_cmds.append("A=M")
+        else:
+            asm_cmds.append("A=M+1")
+            asm_cmds.extend(["A=A+1"] * (index - 1))
         return asm_cmds
 
-    # pushes the value mapped at segment[index] onto the stack.
-    def _asm_push_segment(self, segment, index):
+    # loads the value mapped at segment[index] into D.
+    def _asm_load_segment(self, segment, index):
         if segment not in config.SEGMENTS.keys():
             raise CodeError(segment, "No predefined symbol is defined for this segment")
         if segment == config.S_CONSTANT:
-            return self._asm_push_constant(index)
+            if index in self.ALU_CONSTANTS:
+                return ["D={}".format(self.ALU_CONSTANTS[index])]
+            # constants folded by the vm optimizer can be negative
+            if index == -32768:
+                return ["@32767", "D=-A", "D=D-1"]
+            if index < 0:
+                return ["@{}".format(-index), "D=-A"]
+            return ["@{}".format(index), "D=A"]
+
+        address = self._asm_fixed_address(segment, index)
+        if address is not None:
+            return [address, "D=M"]
 
-        if segment == config.S_TEMP:
-            return self._asm_push_temp(index)
-
-        if segment == config.S_POINTER:
-            return self._asm_push_pointer(index)
-
-        if segment == config.S_STATIC:
-            return self._asm_push_static(index)
-
-        # if we got this far, process the push command as 
-        # pushing the value at segment[index] onto the stack
         asm_segment = config.SEGMENTS[segment]
-        asm_cmds = [
-            "@{}".format(asm_segment),       # A=SEG
-            "D=M",                           # D=*SEG
-            "@{}".format(index),             # A=index
-            "D=D+A",                         # D=SEG+index
-            "A=D",                           # A=SEG+index
-            "D=M",                           # D=M[SEG+index]
-        ]
+        increment = self._asm_increment_address(segment, index)
+        return self._shortest(
+            increment and increment + ["D=M"],
+            [
+                "@{}".format(asm_segment),   # A=SEG
+                "D=M",                       # D=*SEG
+                "@{}".format(index),         # A=index
+                "A=D+A",                     # A=SEG+index
+                "D=M",                       # D=M[SEG+index]
+            ])
+
+    # pushes the value mapped at segment[index] onto the stack.
+    def _asm_push_segment(self, segment, index):
+        asm_cmds = self._asm_load_segment(segment, index)
         asm_cmds.extend(self._asm_push_d())
+        if segment == config.S_CONSTANT and index in self.ALU_CONSTANTS:
+            return self._shortest(asm_cmds, [
+                "@SP",
+                "AM=M+1",                    # SP++
+                "A=A-1",
+                "M={}".format(self.ALU_CONSTANTS[index]),
+            ])
         return asm_cmds
-    
+
     # pop the value pointed to by SP into segment[index] 
     def _asm_pop_segment(self, segment, index):
         if segment not in config.SEGMENTS.keys() or segment == config.S_CONSTANT:
             raise CodeError(segment, "No predefined symbol is defined for this segment")
 
-        if segment == config.S_TEMP:
-            return self._asm_pop_temp(index)
-        
-        if segment == config.S_POINTER:
-            return self._asm_pop_pointer(index)
-        
-        if segment == config.S_STATIC:
-            return self._asm_pop_static(index)
+        asm_cmds = self._asm_pop_d()
+        asm_cmds.extend(self._asm_store_d(segment, index))
+        if config.SEGMENTS[segment] is None:
+            return asm_cmds
 
-        # if we got this far, process the push command as 
-        # popping from stack and storing at value at segment[index]
+        # compute the address before popping, so no value has to be parked
         asm_segment = config.SEGMENTS[segment]
-        asm_cmds = [
+        generic = [
             "@{}".format(asm_segment),
             "D=M",
             "@{}".format(index),
@@ -552,14 +760,81 @@ class CodeGenerator():
             "@R13",
             "M=D",
         ]
-        asm_cmds.extend(self._asm_pop_d())
-        asm_cmds.extend([
+        generic.extend(self._asm_pop_d())
+        generic.extend([
             "@R13",
             "A=M",
             "M=D",
         ])
+        return self._shortest(asm_cmds, generic)
+
+    # store D, holding the popped value, in segment[index]
+    def _asm_store_d(self, segment, index):
+        if segment not in config.SEGMENTS.keys() or segment == config.S_CONSTANT:
+            raise CodeError(segment, "No predefined symbol is defined for this segment")
+
+        address = self._asm_fixed_address(segment, index)
+        if address is not None:
+            return [address, "M=D"]
+
+        # the address has to be computed in D, so park the value in R13
+        # and get both back from their sum
+        asm_segment = config.SEGMENTS[segment]
+        increment = self._asm_increment_address(segment, index)
+        return self._shortest(
+            increment and increment + ["M=D"],
+            [
+                "@R13",
+                "M=D",                          # R13=value
+                "@{}".format(asm_segment),
+                "D=M",
+                "@{}".format(index),
+                "D=D+A",                        # D=SEG+index
+                "@R13",
+                "D=D+M",                        # D=SEG+index+value
+                "A=D-M",                        # A=SEG+index
+                "D=D-A",                        # D=value
+                "M=D",
+            ])
+
+    # write the top of the stack cached in D to memory, if it is cached
+    def _flush(self):
+        if not self._d_cached:
+            return []
+        self._d_cached = False
+        return self._asm_push_d()
+
+    # take the top of the stack into D, from the cache when it is there
+    def _pop_to_d(self):
+        if self._d_cached:
+            self._d_cached = False
+            return []
+        return self._asm_pop_d()
+
+    # make the value in D the top of the stack. in stack cache mode it is
+    # kept in D until the next command needs the register or memory
+    def _push_from_d(self):
+        if self._stack_cache:
+            self._d_cached = True
+            return []
+        return self._asm_push_d()
+
+    # helper method to turn x-y in D into the result of a comparison in D
+    # (stack cache mode), true (-1) if x-y jump 0 holds, else false (0)
+    def _asm_compare_d(self, jump, true_label, done_label):
+        self._d_cached = True
+        asm_cmds = [
+            "@{}".format(true_label),
+            "D;{}".format(jump),
+            "D=0",
+            "@{}".format(done_label),
+            "0;JMP",
+            "({})".format(true_label),
+            "D=-1",
+            "({})".format(done_label),
+        ]
         return asm_cmds
-    
+
     # helper method to push the value of the D register to the stack
     def _asm_push_d(self):
         asm_cmds = [
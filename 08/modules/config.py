@@ -9,6 +9,12 @@ C_LABEL = "C_LABEL"
 C_GOTO = "C_GOTO"
 C_IF = "C_IF"
 
+# superinstructions made up by the vm optimizer, they never appear in vm files
+C_MOVE = "C_MOVE"                   # push segment index / pop segment index
+C_ADD_CONSTANT = "C_ADD_CONSTANT"   # push constant n / add (sub with -n)
+C_IF_COMPARE = "C_IF_COMPARE"       # comparison / if-goto (not folded into the comparison)
+C_IF_NOT = "C_IF_NOT"               # not / if-goto
+
 S_CONSTANT = "constant"
 S_LOCAL = "local"
 S_ARGUMENT = "argument"
@@ -1,75 +1,88 @@
 from .parse_error import ParseError
+from .vm_command import VmCommand
 from . import config
 
 class Parser():
     """Parser class responsible for parsing vm commands into assembly.
 
+    Every line is parsed once into a VmCommand, the command and its number
+    of arguments are looked up in config.COMMANDS. commands() generates the
+    commands of the whole input, has_more_commands()/advance() step through
+    it one line at a time.
+
     Attributes:
         _input -- list of vm commands, one line per list element
         _numlines -- number of vm commands
         _index -- current index of instruction in _input
+        _command -- VmCommand of the current line, None for a blank line
     """
 
     def __init__(self, input):
         self._input = input
         self._numlines = len(self._input)
         self._index = -1
-    
+        self._command = None
+
     # return the current line with no leading/trailing whitespace and no comments
     def current_line(self):
         no_comment = self._input[self._index].split("//")[0]
         return no_comment.strip()
 
+    # parse a line into a VmCommand, returns None for blank lines and comments
+    def parse(self, line, line_num=None):
+        line = line.split("//")[0].strip()
+        split = line.split()
+        if len(split) == 0:
+            return None
+
+        command = split[0]
+        if command not in config.COMMANDS:
+            raise ParseError(line, "Invalid command")
+        nargs = config.COMMANDS[command]["args"]
+        command_type = config.COMMANDS[command]["type"]
+        if len(split) - 1 != nargs:
+            raise ParseError(line, "Invalid number of arguments for this command.")
+
+        # special case for arithmetic commands, the command itself is arg1.
+        if command_type == config.C_ARITHMETIC:
+            return VmCommand(command_type, command, None, line_num)
+        if nargs < 2:
+            return VmCommand(command_type, split[1] if nargs else None, None, line_num)
+        try:
+            return VmCommand(command_type, split[1], int(split[2]), line_num)
+        except ValueError:
+            raise ParseError(line, "arg2 must be an integer")
+
+    # generate the commands of the whole input, skipping blank lines
+    def commands(self):
+        for (line_num, line) in enumerate(self._input, 1):
+            command = self.parse(line, line_num)
+            if command is not None:
+                yield command
+
     # return true if there are more commands to process
     def has_more_commands(self):
         if self._index < (self._numlines - 1):
             return True
         else:
             return False
-    
+
     # advance the current command
     def advance(self):
         if self.has_more_commands():
             self._index += 1
-    
+            self._command = self.parse(self._input[self._index], self._index + 1)
+
     # return the current command type of the existing instruction
     def command_type(self):
-        line = self.current_line()
-        split = line.split()
-        
-        if len(split) == 0:
+        if self._command is None:
             return config.C_EMPTY_LINE
-        
-        command = split[0]
-        nargs = len(split) - 1
-        
-        if command in config.COMMANDS.keys():
-            # valid command, check # of arguments
-            if config.COMMANDS[command]["args"] == nargs:
-                return config.COMMANDS[command]["type"]
-            raise ParseError(self.current_line(), "Invalid number of arguments for this command.")
-        raise ParseError(self.current_line(), "Invalid command")
-        
+        return self._command.command_type
 
     # return the first argument of the current command
     def arg1(self):
-        # if an exeception is raised, its an invalid command or has wrong # of params
-        cmd_type = self.command_type()
+        return self._command.arg1
 
-        # special case for arithmetic commands, the command itself is arg1.
-        if cmd_type == config.C_ARITHMETIC:
-            return self.current_line()
-        
-        split = self.current_line().split()
-        return split[1]
-        
     # return the second argument of the current command
     def arg2(self):
-        # if an exeception is raised, its an invalid command or has wrong # of params
-        cmd_type = self.command_type()
-        split = self.current_line().split()
-
-        try:
-            return int(split[2])
-        except ValueError:
-            raise ParseError(self.current_line(), "arg2 must be an integer")
\ No newline at end of file
+        return self._command.arg2
@@ -0,0 +1,152 @@
+from .vm_command import VmCommand
+from . import config
+
+class VmOptimizer():
+    """Optimizer of the vm commands of a file, run between the parser and the
+    code generator.
+
+    Commands are the VmCommands generated by the parser. They are split
+    into basic blocks: a block starts at a function or a label and ends
+    after goto, if-goto or return, so every block belongs to a single
+    function. Nothing can jump into the middle of a block, so the commands
+    of a block are rewritten as long as the stack ends up the same:
+
+        push constant 2 / push constant 3 / add     -> push constant 5
+        push constant 0 / not                       -> push constant -1
+        push constant 0 / if-goto L                 -> (nothing)
+        push local 1 / pop local 1                  -> (nothing)
+        push argument 0 / pop pointer 0             -> move
+        push constant 1 / add                       -> add constant 1
+        lt / not / if-goto L                        -> if ge goto L
+        not / if-goto L                             -> if not goto L
+
+    move, add constant, if compare and if not are superinstructions
+    (config.C_MOVE, ...), the code generator has asm templates for them.
+    Folded constants can be negative, the code generator loads them as is.
+
+    A block that follows goto or return without starting with a label can
+    never run and is left out.
+
+    Attributes:
+        BINARY -- binary arithmetic commands, as functions on signed words
+        UNARY -- unary arithmetic commands, as functions on signed words
+        INVERSE -- comparison that holds when a comparison does not
+    """
+    BINARY = {
+        "add": lambda x, y: x + y,
+        "sub": lambda x, y: x - y,
+        "and": lambda x, y: x & y,
+        "or": lambda x, y: x | y,
+        # comparisons test the sign of x-y like the generated code, overflow included
+        "eq": lambda x, y: -1 if VmOptimizer.word(x - y) == 0 else 0,
+        "gt": lambda x, y: -1 if VmOptimizer.word(x - y) > 0 else 0,
+        "lt": lambda x, y: -1 if VmOptimizer.word(x - y) < 0 else 0,
+    }
+    UNARY = {
+        "neg": lambda x: -x,
+        "not": lambda x: ~x,
+    }
+    INVERSE = {
+        "eq": "ne",
+        "gt": "le",
+        "lt": "ge",
+    }
+
+    # wrap an integer to a signed 16 bit word
+    @staticmethod
+    def word(value):
+        return ((value + 0x8000) & 0xFFFF) - 0x8000
+
+    # optimize the commands of a vm file, yields the optimized commands.
+    # commands are consumed one block at a time
+    def optimize(self, commands):
+        reachable = True
+        for block in self._blocks(commands):
+            if block[0].command_type in (config.C_LABEL, config.C_FUNCTION):
+                reachable = True
+            if not reachable:
+                continue
+            block = self._rewrite(block)
+            yield from block
+            if block and block[-1].command_type in (config.C_GOTO, config.C_RETURN):
+                reachable = False
+
+    # split commands into basic blocks
+    def _blocks(self, commands):
+        block = []
+        for command in commands:
+            if block and command.command_type in (config.C_LABEL, config.C_FUNCTION):
+                yield block
+                block = []
+            block.append(command)
+            if command.command_type in (config.C_GOTO, config.C_IF, config.C_RETURN):
+                yield block
+                block = []
+        if block:
+            yield block
+
+    # rewrite the commands of a block from left to right. a rewrite can
+    # complete a sequence that starts up to two commands before it
+    def _rewrite(self, block):
+        i = 0
+        while i < len(block):
+            match = self._match(block, i)
+            if match is None:
+                i += 1
+                continue
+            (length, commands) = match
+            block[i:i + length] = commands
+            i = max(i - 2, 0)
+        return block
+
+    # helper function to make a push constant command
+    def _constant(self, value, line_num):
+        return VmCommand(config.C_PUSH, config.S_CONSTANT, self.word(value), line_num)
+
+    # helper function to check for push constant
+    def _is_constant(self, command):
+        return command.command_type == config.C_PUSH and command.arg1 == config.S_CONSTANT
+
+    # helper function to check for an arithmetic command in commands
+    def _is_arithmetic(self, command, commands):
+        return command.command_type == config.C_ARITHMETIC and command.arg1 in commands
+
+    # return (number of commands, replacement) for a sequence starting at
+    # block[i] that can be rewritten, else None. the replacement takes the
+    # line number of the first command
+    def _match(self, block, i):
+        command = block[i]
+        following = block[i + 1:i + 3]
+        if not following:
+            return None
+        after = following[0]
+        line_num = command.line_num
+
+        if self._is_constant(command):
+            if len(following) == 2 and self._is_constant(after) and self._is_arithmetic(following[1], self.BINARY):
+                return (3, [self._constant(self.BINARY[following[1].arg1](command.arg2, after.arg2), line_num)])
+            if self._is_arithmetic(after, self.UNARY):
+                return (2, [self._constant(self.UNARY[after.arg1](command.arg2), line_num)])
+            if after.command_type == config.C_IF:
+                return (2, [VmCommand(config.C_GOTO, after.arg1, None, line_num)] if command.arg2 != 0 else [])
+            if self._is_arithmetic(after, ("add", "sub")):
+                value = command.arg2 if after.arg1 == "add" else -command.arg2
+                if value == 0:
+                    return (2, [])
+                if abs(value) <= 32767:
+                    return (2, [VmCommand(config.C_ADD_CONSTANT, value, None, line_num)])
+
+        if command.command_type == config.C_PUSH and after.command_type == config.C_POP and after.arg1 != config.S_CONSTANT:
+            if (command.arg1, command.arg2) == (after.arg1, after.arg2):
+                return (2, [])
+            return (2, [VmCommand(config.C_MOVE, (command.arg1, command.arg2), (after.arg1, after.arg2), line_num)])
+
+        if self._is_arithmetic(command, self.INVERSE):
+            if after.command_type == config.C_IF:
+                return (2, [VmCommand(config.C_IF_COMPARE, command.arg1, after.arg1, line_num)])
+            if len(following) == 2 and self._is_arithmetic(after, ("not",)) and following[1].command_type == config.C_IF:
+                return (3, [VmCommand(config.C_IF_COMPARE, self.INVERSE[command.arg1], following[1].arg1, line_num)])
+
+        if self._is_arithmetic(command, ("not",)) and after.command_type == config.C_IF:
+            return (2, [VmCommand(config.C_IF_NOT, after.arg1, None, line_num)])
+        return None
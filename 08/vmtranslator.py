@@ -1,14 +1,194 @@
 import argparse
+import importlib.util
 import re
 import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
+from modules.asm_writer import AsmWriter
+from modules.call_graph import CallGraph
 from modules.parser import Parser
 from modules.parse_error import ParseError
 from modules.code_error import CodeError
 from modules.code_generator import CodeGenerator
+from modules.vm_optimizer import VmOptimizer
 from modules import config
 
-def main(input):
+# the modules package of the assembler in project 06. it is loaded as the
+# package hack_assembler, its own name would clash with the modules package here
+ASSEMBLER_MODULES = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "06", "modules")
+ASSEMBLER_PACKAGE = "hack_assembler"
+
+# files submitted per job of the process pool ahead of the file being written
+FILES_IN_FLIGHT = 2
+
+# helper function to load the assembler package once
+def load_assembler():
+    if ASSEMBLER_PACKAGE not in sys.modules:
+        spec = importlib.util.spec_from_file_location(ASSEMBLER_PACKAGE, os.path.join(ASSEMBLER_MODULES, "__init__.py"),
+                                                      submodule_search_locations=[ASSEMBLER_MODULES])
+        package = importlib.util.module_from_spec(spec)
+        sys.modules[ASSEMBLER_PACKAGE] = package
+        spec.loader.exec_module(package)
+
+# decode generated asm lines into the instruction records of the assembler.
+# the code generator emits the same few lines over and over, so every
+# distinct line is decoded only once and its (immutable) record reused.
+# labels, function and static symbols all contain . or $ and are mostly
+# used once, they are not kept, so the memo does not grow with the program
+def decode_lines(lines, parser):
+    decoded = {}
+    for line in lines:
+        if line in decoded:
+            instruction = decoded[line]
+        else:
+            instruction = parser.decode(line)
+            if "." not in line and "$" not in line:
+                decoded[line] = instruction
+        if instruction is not None:
+            yield instruction
+
+# assemble the generated asm lines straight into a .hack file, labels and
+# variables are resolved in memory
+def write_hack(asm_lines, output):
+    load_assembler()
+    from hack_assembler.assembly import assemble_instructions
+    from hack_assembler.hack_writer import HackWriter
+    from hack_assembler.parser import Parser as AsmParser
+
+    tmpfile = "{}.tmp".format(output)
+    try:
+        with open(tmpfile, "w+b") as f:
+            assemble_instructions(decode_lines(asm_lines, AsmParser([])), HackWriter(f))
+    except:
+        if os.path.exists(tmpfile):
+            os.remove(tmpfile)
+        raise
+    os.replace(tmpfile, output)
+
+# stream the generated asm lines to an .asm file. if consumer is given, the
+# lines are passed on to it as they are written (e.g. write_hack)
+def write_asm(asm_lines, output, consumer=None):
+    tmpfile = "{}.tmp".format(output)
+    try:
+        with open(tmpfile, "w") as f:
+            writer = AsmWriter(f)
+            if consumer is None:
+                writer.write_lines(asm_lines)
+            else:
+                consumer(writer.tee(asm_lines))
+    except:
+        if os.path.exists(tmpfile):
+            os.remove(tmpfile)
+        raise
+    os.replace(tmpfile, output)
+
+# generate the asm lines of a single vm file, with a code generator of its own.
+# with shared, calls, returns and comparisons jump to the shared routines,
+# with stack_cache, the top of the stack is kept in D between commands,
+# with optimize, the commands go through the vm optimizer first.
+# if functions is given, only the functions in it are translated
+def translate_file(file, shared=False, stack_cache=False, functions=None, optimize=False):
+    # open and load the file into a list
+    vm_input = []
+    with open(file) as f:
+        vm_input = f.readlines()
+    vmfile = file.strip(".vm")
+    vmfile = os.path.split(vmfile)[-1]
+
+    # each vm file gets its own parser and code generator. the vmfile name
+    # is used to generate static variable symbols and to namespace labels
+    commands = Parser(vm_input).commands()
+    if optimize:
+        commands = VmOptimizer().optimize(commands)
+    code_gen = CodeGenerator(vmfile, shared, stack_cache)
+    skipping = False
+    for command in commands:
+        (command_type, arg1, arg2) = (command.command_type, command.arg1, command.arg2)
+        if functions is not None and command_type == config.C_FUNCTION:
+            # the program never calls this function, leave it out
+            skipping = arg1 not in functions
+        if skipping:
+            continue
+        if command_type in config.PUSH_POP_COMMANDS:
+            yield from code_gen.generate_push_pop(command_type, arg1, arg2)
+        elif command_type == config.C_ARITHMETIC:
+            yield from code_gen.generate_arithmetic(arg1)
+        elif command_type == config.C_LABEL:
+            yield from code_gen.generate_label(arg1)
+        elif command_type == config.C_GOTO:
+            yield from code_gen.generate_goto(arg1)
+        elif command_type == config.C_IF:
+            yield from code_gen.generate_if(arg1)
+        elif command_type == config.C_FUNCTION:
+            yield from code_gen.generate_function(arg1, arg2)
+        elif command_type == config.C_CALL:
+            yield from code_gen.generate_call(arg1, arg2)
+        elif command_type == config.C_RETURN:
+            yield from code_gen.generate_return()
+        elif command_type == config.C_MOVE:
+            yield from code_gen.generate_move(arg1, arg2)
+        elif command_type == config.C_ADD_CONSTANT:
+            yield from code_gen.generate_add_constant(arg1)
+        elif command_type == config.C_IF_COMPARE:
+            yield from code_gen.generate_if_compare(arg1, arg2)
+        elif command_type == config.C_IF_NOT:
+            yield from code_gen.generate_if_not(arg1)
+    yield from code_gen.generate_end()
+
+# translate a single vm file into a list of asm lines, as a job of a process pool
+def translate_job(file, shared=False, stack_cache=False, functions=None, optimize=False):
+    return list(translate_file(file, shared, stack_cache, functions, optimize))
+
+# build the call graph of the whole program
+def build_call_graph(infiles):
+    graph = CallGraph()
+    for file in infiles:
+        with open(file) as f:
+            graph.add_file(file, Parser(f.readlines()))
+    return graph
+
+# generate the asm lines of the whole program: the bootstrap code first, then
+# the files in the order given. lines are generated as they are consumed.
+# with more than one job, files are translated in parallel by a process pool.
+# at most FILES_IN_FLIGHT files per job are submitted ahead of the one being
+# consumed, so only those are held in memory however slow the consumer is.
+# with shared, the bootstrap code is followed by the shared routines.
+# with prune, only the functions reachable from Sys.init are translated, and
+# files without any are skipped (unless the program has no Sys.init)
+def translate(infiles, jobs=1, shared=False, stack_cache=False, prune=False, optimize=False):
+    yield from CodeGenerator(shared=shared).generate_init()
+    functions = None
+    if prune:
+        graph = build_call_graph(infiles)
+        if graph.defines(CallGraph.ENTRY):
+            functions = frozenset(graph.reachable())
+            infiles = [file for file in infiles if graph.needs_file(file, functions)]
+    if jobs == 1 or len(infiles) == 1:
+        for file in infiles:
+            yield from translate_file(file, shared, stack_cache, functions, optimize)
+        return
+    job = partial(translate_job, shared=shared, stack_cache=stack_cache, functions=functions, optimize=optimize)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        in_flight = deque()
+        for file in infiles:
+            if len(in_flight) >= jobs * FILES_IN_FLIGHT:
+                yield from in_flight.popleft().result()
+            in_flight.append(executor.submit(job, file))
+        while in_flight:
+            yield from in_flight.popleft().result()
+
+# translate the vm program into output (.asm). with hack, the program is
+# assembled in memory and written to a .hack file next to output instead,
+# and the .asm is only written as well if asm is set (for debugging).
+# files are translated by jobs processes (default: number of cpus).
+# shared emits call, return and comparisons as shared routines (smaller code)
+# stack_cache keeps the top of the stack in D (fewer instructions and cycles)
+# prune leaves out the functions the program never calls
+# optimize runs the vm optimizer (constant folding, superinstructions)
+def main(input, hack=False, asm=False, jobs=None, shared=False, stack_cache=False, prune=False, optimize=False):
     infiles = []
     # determine if the inputs is a directory or vmfile
     if re.search("\.vm$", input):
@@ -20,7 +200,8 @@ def main(input):
         # input is a directory
         # output file name should be <dirname>.asm located in that directory
         try:
-            files = os.listdir(input)
+            # sorted, so the output does not depend on the order of the directory
+            files = sorted(os.listdir(input))
             for f in files:
                 if re.search("\.vm$", f):
                     infiles.append(os.path.join(input, f))
@@ -36,62 +217,48 @@ def main(input):
         print("No files found with .vm suffix in {} directory. Exiting".format(input))
         exit(1)
     
-    # single code generator for all vm files, single ASM output
-    code_gen = CodeGenerator()
-    asm_output = code_gen.generate_init()
-    #asm_output = []
+    # single ASM output, the files are translated independently
+    asm_lines = translate(infiles, jobs if jobs is not None else os.cpu_count() or 1, shared, stack_cache, prune, optimize)
 
-    # loop through all .vm files
-    for file in infiles:
-        # open and load the file into a list
-        vm_input = []
-        with open(file) as f:
-            vm_input = f.readlines()
-        vmfile = file.strip(".vm")
-        vmfile = os.path.split(vmfile)[-1]
-
-        # each vm file gets its own parser
-        parser = Parser(vm_input)
-        while parser.has_more_commands():
-            # set vmfile name, used to generate static variable symbols
-            code_gen.vmfile = vmfile
-            parser.advance()
-            try:
-                if parser.command_type() is config.C_EMPTY_LINE:
-                    # skip whitespace/blank lines
-                    continue
-                elif parser.command_type() in config.PUSH_POP_COMMANDS:
-                    asm_output.extend(code_gen.generate_push_pop(parser.command_type(), parser.arg1(), parser.arg2()))
-                elif parser.command_type() == config.C_ARITHMETIC:
-                    asm_output.extend(code_gen.generate_arithmetic(parser.arg1()))
-                elif parser.command_type() == config.C_LABEL:
-                    asm_output.extend(code_gen.generate_label(parser.arg1()))
-                elif parser.command_type() == config.C_GOTO:
-                    asm_output.extend(code_gen.generate_goto(parser.arg1()))
-                elif parser.command_type() == config.C_IF:
-                    asm_output.extend(code_gen.generate_if(parser.arg1()))
-                elif parser.command_type() == config.C_FUNCTION:
-                    asm_output.extend(code_gen.generate_function(parser.arg1(), parser.arg2()))
-                elif parser.command_type() == config.C_CALL:
-                    asm_output.extend(code_gen.generate_call(parser.arg1(), parser.arg2()))
-                elif parser.command_type() == config.C_RETURN:
-                    asm_output.extend(code_gen.generate_return())
-                    
-            except ParseError as err:
-                print("Parser error. Expression: <{}>. Error detail: {}".format(err.expression, err.message))
-                exit(1)
-            except CodeError as err:
-                print("Code generator error. Expression: <{}>. Error detail: {}".format(err.expression, err.message))
-                exit(1)
-
-    # write out asm file
-    with open(output, "w") as f:
-        for line in asm_output:
-            f.write(line)
-            f.write("\n")
+    assembler_error = ()
+    if hack:
+        load_assembler()
+        from hack_assembler.parse_error import ParseError as assembler_error
+    try:
+        if not hack:
+            write_asm(asm_lines, output)
+        elif not asm:
+            write_hack(asm_lines, re.sub(r"\.asm$", ".hack", output))
+        else:
+            write_asm(asm_lines, output, lambda lines: write_hack(lines, re.sub(r"\.asm$", ".hack", output)))
+    except ParseError as err:
+        print("Parser error. Expression: <{}>. Error detail: {}".format(err.expression, err.message))
+        exit(1)
+    except CodeError as err:
+        print("Code generator error. Expression: <{}>. Error detail: {}".format(err.expression, err.message))
+        exit(1)
+    except assembler_error as err:
+        print("Assembler error. Expression: <{}>. Error detail: {}".format(err.expression, err.message))
+        exit(1)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument("input", help="input .vm file or directory containing .vm files")
+    parser.add_argument("--hack", action="store_true",
+                        help="assemble in memory and write a .hack file, with the assembler of project 06")
+    parser.add_argument("--asm", action="store_true",
+                        help="with --hack, also write the .asm file (for debugging)")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of vm files translated in parallel (default: number of cpus)")
+    parser.add_argument("--shared", action="store_true",
+                        help="jump to shared call, return and comparison routines instead of inlining them (smaller code)")
+    parser.add_argument("--stack-cache", action="store_true",
+                        help="keep the top of the stack in the D register between vm commands (fewer instructions and cycles)")
+    parser.add_argument("--prune", action="store_true",
+                        help="only translate the functions reachable from Sys.init (smaller code)")
+    parser.add_argument("-O", "--optimize", action="store_true",
+                        help="fold constants and fuse common command sequences before generating code")
     args = parser.parse_args()
-    main(args.input)
\ No newline at end of file
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("-j/--jobs must be at least 1")
+    main(args.input, args.hack, args.asm, args.jobs, args.shared, args.stack_cache, args.prune, args.optimize)
\ No newline at end of file